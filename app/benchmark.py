@@ -0,0 +1,378 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import threading
+import contextlib
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from process_data import merge_chunks_by_section
+from load_to_vectordb import load_data_to_chromadb, load_data_to_numpy_store
+from embeddings import EMBEDDING_BACKENDS, DEFAULT_BACKEND
+from vector_store import VECTOR_STORES, DEFAULT_VECTOR_STORE
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# Stages timed inside ask(), plus the end-to-end calls
+STAGES = ["embed", "search", "rerank", "prompt_build", "generate"]
+TOTALS = ["retrieve_total", "ask_total"]
+
+SECTIONS = ["General", "Personality", "Appearance", "Biography", "Relationships", "Abilities", "History", "Trivia"]
+TYPES = ["characters", "events", "locations"]
+SYLLABLES = ["ar", "bel", "cas", "dar", "eo", "fi", "gor", "hal", "ix", "ju", "ka", "lor",
+             "mus", "nar", "or", "pax", "quin", "ro", "sev", "ta", "ul", "vix", "wen", "yo", "zan"]
+
+
+# ============================================
+# SYNTHETIC CORPUS
+# ============================================
+
+def _word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def _name(rng):
+    return f"{_word(rng).capitalize()} {_word(rng).capitalize()}"
+
+
+def _paragraph(rng, names):
+    sentences = []
+    for _ in range(rng.randint(3, 8)):
+        words = [_word(rng) for _ in range(rng.randint(8, 20))]
+        # Mention other entities so retrieval has something to discriminate on
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words)), rng.choice(names))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def generate_corpus(output_path, n_chunks, n_series=3, seed=0):
+    """
+    Write a synthetic corpus in the process_data.py chunk schema
+    
+    Entities get random sections and paragraphs, are chunked with
+    merge_chunks_by_section, and are saved as
+    <output_path>/<series>/<type>/<name>.json until n_chunks is reached.
+    
+    Returns:
+        List of (series, name) pairs that were generated
+    """
+    rng = random.Random(seed)
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    
+    series_names = [f"Synthetic Series {i + 1}" for i in range(n_series)]
+    entities = []
+    total = 0
+    while total < n_chunks:
+        series_name = rng.choice(series_names)
+        doc_type = rng.choice(TYPES)
+        name = _name(rng)
+        known = [n for _, n in entities[-50:]] or [name]
+        
+        sections = []
+        for section in rng.sample(SECTIONS, rng.randint(3, len(SECTIONS))):
+            for _ in range(rng.randint(1, 4)):
+                sections.append({'text': _paragraph(rng, known), 'section': section})
+        chunks = merge_chunks_by_section(sections, name, doc_type, series_name)
+        chunks = chunks[:n_chunks - total]
+        
+        type_path = os.path.join(output_path, series_name, doc_type)
+        os.makedirs(type_path, exist_ok=True)
+        with open(os.path.join(type_path, f"{name} {len(entities)}.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        
+        entities.append((series_name, name))
+        total += len(chunks)
+    return entities
+
+
+def make_questions(entities, n_questions, seed=0):
+    """Question set of (question, series_filter) about generated entities"""
+    rng = random.Random(seed)
+    templates = ["Who is {name}?", "What is {name}'s personality like?", "Describe {name}'s appearance.",
+                 "What is the history of {name}?"]
+    questions = []
+    for i in range(n_questions):
+        series_name, name = rng.choice(entities)
+        question = rng.choice(templates).format(name=name)
+        questions.append((question, series_name if i % 2 else None))
+    return questions
+
+
+# ============================================
+# STUB OLLAMA SERVER
+# ============================================
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/tags and /api/generate like Ollama, with simulated latency"""
+    
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.server.model_name}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+    
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, status=404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        num_predict = request.get("options", {}).get("num_predict", self.server.num_tokens)
+        eval_count = min(self.server.num_tokens, num_predict)
+        # Rough token count for the prompt: ~4 characters per token
+        prompt_eval_count = max(1, len(request.get("prompt", "")) // 4)
+        
+        prompt_seconds = prompt_eval_count * self.server.prefill_latency
+        eval_seconds = eval_count * self.server.token_latency
+        time.sleep(prompt_seconds + eval_seconds)
+        
+        self._send_json({
+            "model": request.get("model", self.server.model_name),
+            "response": " ".join(["word"] * eval_count),
+            "done": True,
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(eval_seconds * 1e9),
+            "total_duration": int((prompt_seconds + eval_seconds) * 1e9),
+        })
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_ollama(model_name="llama3.2:latest", token_latency=0.02, prefill_latency=0.0005, num_tokens=200, port=0):
+    """
+    Start a stub Ollama server in a background thread
+    
+    Args:
+        model_name: Model name reported by /api/tags
+        token_latency: Seconds per generated token
+        prefill_latency: Seconds per prompt token
+        num_tokens: Tokens generated per request (capped by num_predict)
+        port: Port to bind (0 picks a free one)
+    
+    Returns:
+        (server, url) - call server.shutdown() when done
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubOllamaHandler)
+    server.model_name = model_name
+    server.token_latency = token_latency
+    server.prefill_latency = prefill_latency
+    server.num_tokens = num_tokens
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ============================================
+# REPLAY
+# ============================================
+
+class StageTimer:
+    """Accumulates wall-clock time of wrapped callables per stage"""
+    
+    def __init__(self):
+        self.current = defaultdict(float)
+    
+    def reset(self):
+        self.current = defaultdict(float)
+    
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current[stage] += time.perf_counter() - start
+        return timed
+
+
+def summarize(samples):
+    """p50/p95/p99/mean in milliseconds"""
+    ordered = sorted(s * 1000 for s in samples)
+    if not ordered:
+        return {}
+    
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    
+    return {
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "mean_ms": sum(ordered) / len(ordered),
+        "n": len(ordered),
+    }
+
+
+def replay(rag, questions, n_results):
+    """
+    Run each question through getRelevantContext and ask()
+    
+    Returns:
+        Dict of stage -> list of durations in seconds
+    """
+    timer = StageTimer()
+    model = rag.model
+    collection = rag.collection
+    model.encode = timer.wrap("embed", model.encode)
+    collection.query = timer.wrap("search", collection.query)
+    rag.buildPrompt = timer.wrap("prompt_build", rag.buildPrompt)
+    rag.callOllama = timer.wrap("generate", rag.callOllama)
+    if rag.reranker:
+        rag.reranker.rerank = timer.wrap("rerank", rag.reranker.rerank)
+    
+    samples = defaultdict(list)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm up caches and the HTTP connection
+        rag.ask(questions[0][0], series_filter=questions[0][1], n_results=n_results)
+        
+        for question, series_filter in questions:
+            start = time.perf_counter()
+            rag.getRelevantContext(question, series_filter, n_results)
+            samples["retrieve_total"].append(time.perf_counter() - start)
+            
+            # getRelevantContext just scored these candidates; time real scoring
+            if rag.reranker:
+                rag.reranker.clear_cache()
+            timer.reset()
+            start = time.perf_counter()
+            rag.ask(question, series_filter=series_filter, n_results=n_results)
+            samples["ask_total"].append(time.perf_counter() - start)
+            for stage in STAGES:
+                if stage != "rerank" or rag.reranker:
+                    samples[stage].append(timer.current[stage])
+    return samples
+
+
+def run_size(n_chunks, args, ollama_url):
+    """Generate, index and replay one corpus size"""
+    from ollama_chat import BookWormOllamaRAG
+    
+    size_dir = os.path.join(args.work_dir, str(n_chunks))
+    corpus_path = os.path.join(size_dir, "data")
+    index_path = os.path.join(size_dir, "index")
+    
+    print(f"\n{'='*60}")
+    print(f"Corpus: {n_chunks} chunks")
+    print(f"{'='*60}")
+    
+    start = time.perf_counter()
+    entities = generate_corpus(corpus_path, n_chunks, seed=args.seed)
+    print(f"  Generated {len(entities)} entities in {time.perf_counter() - start:.1f}s")
+    
+    # An index left by a previous run is replaced blue/green, like in production
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.store == "numpy":
+            load_data_to_numpy_store(data_path=corpus_path, store_path=index_path, backend=args.backend, grace_seconds=0)
+        else:
+            load_data_to_chromadb(data_path=corpus_path, backend=args.backend, db_path=index_path, grace_seconds=0)
+    index_seconds = time.perf_counter() - start
+    print(f"  Indexed in {index_seconds:.1f}s ({n_chunks / index_seconds:.0f} chunks/s)")
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag = BookWormOllamaRAG(ollama_url=ollama_url, embedding_backend=args.backend,
+                                vector_store=args.store, index_path=index_path, rerank=args.rerank)
+    questions = make_questions(entities, args.questions, seed=args.seed)
+    samples = replay(rag, questions, args.n_results)
+    
+    timed = [stage for stage in STAGES + TOTALS if samples[stage]]
+    stages = {stage: summarize(samples[stage]) for stage in timed}
+    for stage in timed:
+        row = stages[stage]
+        print(f"  {stage:15} p50 {row['p50_ms']:9.1f} ms   p95 {row['p95_ms']:9.1f} ms   p99 {row['p99_ms']:9.1f} ms")
+    
+    return {
+        "chunks": n_chunks,
+        "entities": len(entities),
+        "index_seconds": index_seconds,
+        "questions": len(questions),
+        "stages": stages,
+    }
+
+
+def compare(report, baseline):
+    """Print p50/p95 changes against a previous report"""
+    print(f"\n{'='*60}")
+    print("Compared with baseline")
+    print(f"{'='*60}")
+    for size, result in report["results"].items():
+        previous = baseline.get("results", {}).get(size)
+        if not previous:
+            continue
+        print(f"{size} chunks:")
+        for stage, row in result["stages"].items():
+            old = previous["stages"].get(stage)
+            if not old:
+                continue
+            for key in ("p50_ms", "p95_ms"):
+                change = (row[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                marker = "❌" if change > 10 else "  "
+                print(f"  {marker} {stage:15} {key}: {old[key]:9.1f} -> {row[key]:9.1f} ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark with synthetic corpora and a stub Ollama")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated corpus sizes in chunks (default: %(default)s)")
+    parser.add_argument("--questions", type=int, default=50, help="Questions replayed per size")
+    parser.add_argument("--n-results", type=int, default=12)
+    parser.add_argument("--store", choices=VECTOR_STORES, default=DEFAULT_VECTOR_STORE)
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--rerank", action="store_true", help="Rerank retrieved chunks with the cross-encoder")
+    parser.add_argument("--token-latency-ms", type=float, default=20.0, help="Stub Ollama time per generated token")
+    parser.add_argument("--prefill-latency-ms", type=float, default=0.5, help="Stub Ollama time per prompt token")
+    parser.add_argument("--num-tokens", type=int, default=200, help="Tokens the stub generates per answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default="bench_data", help="Where corpora and indexes are written")
+    parser.add_argument("--output", help="Results JSON (default: bench_results/benchmark-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    args = parser.parse_args()
+    
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    server, ollama_url = start_stub_ollama(
+        token_latency=args.token_latency_ms / 1000,
+        prefill_latency=args.prefill_latency_ms / 1000,
+        num_tokens=args.num_tokens
+    )
+    
+    report = {
+        "created_at": time.time(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": {},
+    }
+    try:
+        for n_chunks in sizes:
+            report["results"][str(n_chunks)] = run_size(n_chunks, args, ollama_url)
+    finally:
+        server.shutdown()
+    
+    output = args.output or os.path.join("bench_results", f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Saved results to {output}")
+    
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from embedding_parity import SAMPLE_QUESTIONS
+from vector_store import CHROMA_PATH, NUMPY_STORE_PATH, open_vector_store
+
+
+def directory_size(path):
+    """Total size in bytes of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def version_size(store):
+    """
+    Size in bytes of the index version the alias currently points to
+    
+    Retired versions still inside their grace period aren't counted. For
+    ChromaDB these are the version's segment folders plus chroma.sqlite3,
+    which holds documents and metadata for every collection and can't be
+    split per version.
+    """
+    collection = open_vector_store(store)
+    if store == "numpy":
+        version_path = os.path.join(NUMPY_STORE_PATH, collection.version)
+        return directory_size(version_path if os.path.isdir(version_path) else NUMPY_STORE_PATH)
+    
+    import sqlite3
+    from contextlib import closing
+    
+    sysdb_path = os.path.join(CHROMA_PATH, "chroma.sqlite3")
+    with closing(sqlite3.connect(sysdb_path)) as conn:
+        segments = [row[0] for row in conn.execute(
+            "SELECT segments.id FROM segments JOIN collections ON segments.collection = collections.id "
+            "WHERE collections.name = ?", (collection.version,)
+        )]
+    return os.path.getsize(sysdb_path) + sum(directory_size(os.path.join(CHROMA_PATH, s)) for s in segments)
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB
+    
+    Linux keeps ru_maxrss across exec, so a spawned child would report the
+    parent's peak; VmHWM belongs to the process's own address space.
+    """
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_store(store, query_embeddings, n_results, where, repeats):
+    """
+    Time queries against one store (runs in a spawned child process so
+    memory numbers aren't mixed between stores or inherited from the parent,
+    which holds the embedding model)
+    
+    Returns:
+        Dict with per-query latencies, top-k IDs and peak RSS
+    """
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    collection = open_vector_store(store)
+    open_seconds = time.perf_counter() - start
+    
+    latencies = []
+    top_ids = []
+    for query_embedding in query_embeddings:
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            results = collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where)
+            latencies.append(time.perf_counter() - start)
+        top_ids.append(results["ids"][0])
+    
+    rss_after = peak_rss_mb()
+    return {
+        "open_seconds": open_seconds,
+        "latencies": latencies,
+        "top_ids": top_ids,
+        "peak_rss_mb": rss_after,
+        "rss_growth_mb": rss_after - rss_before,
+    }
+
+
+def exact_top_ids(query_embeddings, n_results, where):
+    """Ground truth: float32 brute-force search over the ChromaDB embeddings"""
+    import numpy as np
+    
+    collection = open_vector_store("chroma")
+    data = collection.get(include=["embeddings"], where=where)
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    scores = queries @ embeddings.T
+    top = np.argsort(-scores, axis=1)[:, :n_results]
+    return [[data["ids"][i] for i in row] for row in top]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ChromaDB and the numpy vector store")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--series", help="Optional series filter")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per question")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+    
+    from embeddings import load_embedding_model, resolve_backend
+    
+    where = {"series": args.series} if args.series else None
+    backend = resolve_backend(open_vector_store("chroma").metadata)
+    if resolve_backend(open_vector_store("numpy").metadata) != backend:
+        raise ValueError("ChromaDB and the numpy store were embedded with different backends")
+    model = load_embedding_model(backend)
+    query_embeddings = model.encode(SAMPLE_QUESTIONS).tolist()
+    
+    truth = exact_top_ids(query_embeddings, args.n_results, where)
+    sizes = {store: version_size(store) for store in ("chroma", "numpy")}
+    
+    report = {}
+    for store in ("chroma", "numpy"):
+        # spawn, not fork: a forked child's ru_maxrss would include the parent's model
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = executor.submit(run_store, store, query_embeddings, args.n_results, where, args.repeats).result()
+        recalls = [
+            len(set(found) & set(expected)) / max(1, len(expected))
+            for found, expected in zip(result["top_ids"], truth)
+        ]
+        latencies_ms = [t * 1000 for t in result["latencies"]]
+        report[store] = {
+            "open_ms": result["open_seconds"] * 1000,
+            "p50_ms": percentile(latencies_ms, 50),
+            "p95_ms": percentile(latencies_ms, 95),
+            "p99_ms": percentile(latencies_ms, 99),
+            f"recall@{args.n_results}": sum(recalls) / len(recalls),
+            "disk_mb": sizes[store] / 1024 / 1024,
+            "peak_rss_mb": result["peak_rss_mb"],
+            "rss_growth_mb": result["rss_growth_mb"],
+        }
+    
+    print(f"\n{'='*80}")
+    print(f"Vector store benchmark ({len(SAMPLE_QUESTIONS)} questions x {args.repeats} runs, k={args.n_results})")
+    print(f"{'='*80}")
+    print(f"{'':10}{'open ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'recall':>10}{'disk MB':>10}{'RSS MB':>10}")
+    for store, row in report.items():
+        print(f"{store:10}{row['open_ms']:>10.1f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+              f"{row[f'recall@{args.n_results}']:>10.3f}{row['disk_mb']:>10.1f}{row['peak_rss_mb']:>10.0f}")
+    print()
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
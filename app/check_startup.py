@@ -0,0 +1,112 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Modules that must not be imported just to start a CLI
+HEAVY_MODULES = ["torch", "sentence_transformers", "chromadb", "transformers", "onnxruntime"]
+
+# Module imports and cheap CLI paths that should stay fast, as (arguments, stdin)
+CLI_MODULES = ["query", "ollama_chat", "load_to_vectordb"]
+CLI_COMMANDS = [
+    (["ollama_chat.py", "--help"], None),
+    (["ollama_chat.py", "--books", "abc"], None),
+    (["ollama_chat.py"], "/quit\n"),
+    (["query.py", "--help"], None),
+    (["load_to_vectordb.py", "--help"], None),
+]
+
+MAX_SECONDS = 1.0
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def profile_import(module_name):
+    """
+    Import a module in a fresh interpreter with -X importtime
+    
+    Returns:
+        (total import time in seconds, list of heavy modules that were imported)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module_name} failed:\n{result.stderr}")
+    
+    total_us = 0
+    heavy = set()
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)', line)
+        if not match:
+            continue
+        name = match.group(4)
+        # Top-level entries (single leading space) carry the cumulative time
+        if len(match.group(3)) == 1:
+            total_us += int(match.group(2))
+        root = name.split('.')[0]
+        if root in HEAVY_MODULES:
+            heavy.add(root)
+    return total_us / 1e6, sorted(heavy)
+
+
+def time_command(args, stdin=None):
+    """Run a CLI command (with optional input) and return its wall-clock time in seconds"""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable] + args,
+        cwd=APP_DIR,
+        input=stdin,
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    """Check that CLI startup doesn't pay for heavy imports"""
+    failures = []
+    
+    print(f"{'='*60}")
+    print("Import-time profile")
+    print(f"{'='*60}")
+    for module_name in CLI_MODULES:
+        seconds, heavy = profile_import(module_name)
+        status = "✅" if not heavy else "❌"
+        print(f"{status} import {module_name}: {seconds*1000:.0f} ms")
+        if heavy:
+            print(f"   heavy modules loaded at import: {', '.join(heavy)}")
+            failures.append(f"import {module_name} loads {', '.join(heavy)}")
+    
+    print(f"\n{'='*60}")
+    print(f"CLI startup (limit {MAX_SECONDS:.1f}s)")
+    print(f"{'='*60}")
+    for args, stdin in CLI_COMMANDS:
+        seconds = time_command(args, stdin)
+        command = " ".join(args)
+        if stdin:
+            command += f" <<< {stdin.strip()}"
+        status = "✅" if seconds < MAX_SECONDS else "❌"
+        print(f"{status} {command}: {seconds*1000:.0f} ms")
+        if seconds >= MAX_SECONDS:
+            failures.append(f"{command} took {seconds:.2f}s")
+    
+    print()
+    if failures:
+        print("❌ Startup check failed:")
+        for failure in failures:
+            print(f"  • {failure}")
+        return 1
+    
+    print("✅ Startup check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
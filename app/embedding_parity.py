@@ -0,0 +1,124 @@
+import argparse
+import time
+
+from embeddings import EMBEDDING_BACKENDS, load_embedding_model
+from load_to_vectordb import load_documents
+
+# Questions used to compare retrieval between backends
+SAMPLE_QUESTIONS = [
+    "Who is Darrow?",
+    "What happens at the Institute?",
+    "Who is Ron Weasley?",
+    "Tell me about Mustang's personality",
+    "What does Sevro look like?",
+    "Who are Hermione Granger's parents?",
+    "Which house is Cassius in?",
+    "Who leads the Howlers?",
+    "What is the Conquering?",
+    "Describe Harry Potter's appearance",
+]
+
+
+def encode(model, texts, batch_size=32):
+    """Encode texts and return (normalized embeddings, seconds taken)"""
+    import numpy as np
+    
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    elapsed = time.perf_counter() - start
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.clip(norms, 1e-12, None), elapsed
+
+
+def check_parity(candidate, reference="torch", data_path="app/data", k=10, questions=SAMPLE_QUESTIONS):
+    """
+    Compare a candidate embedding backend against the reference backend
+    
+    Args:
+        candidate: Backend to check (e.g., "onnx-int8")
+        reference: Backend treated as ground truth
+        data_path: Corpus to embed
+        k: Cutoff for recall@k
+        questions: Queries used for the retrieval comparison
+    
+    Returns:
+        Dict with cosine agreement, recall@k and timings
+    """
+    import numpy as np
+    
+    documents, _, _ = load_documents(data_path)
+    if not documents:
+        raise ValueError(f"No documents found under {data_path}")
+    k = min(k, len(documents))
+    
+    results = {}
+    for backend in (reference, candidate):
+        print(f"Embedding {len(documents)} chunks with {backend}...")
+        model = load_embedding_model(backend)
+        doc_embeddings, doc_seconds = encode(model, documents)
+        query_embeddings, query_seconds = encode(model, questions)
+        results[backend] = {
+            "docs": doc_embeddings,
+            "queries": query_embeddings,
+            "doc_seconds": doc_seconds,
+            "query_seconds": query_seconds,
+        }
+    
+    ref = results[reference]
+    cand = results[candidate]
+    
+    # Cosine agreement between the two embeddings of the same text
+    cosines = np.concatenate([
+        np.sum(ref["docs"] * cand["docs"], axis=1),
+        np.sum(ref["queries"] * cand["queries"], axis=1),
+    ])
+    
+    # Recall@k: overlap of each backend's top-k over the corpus
+    ref_top = np.argsort(-(ref["queries"] @ ref["docs"].T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand["queries"] @ cand["docs"].T), axis=1)[:, :k]
+    recalls = [len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)]
+    
+    return {
+        "reference": reference,
+        "candidate": candidate,
+        "chunks": len(documents),
+        "queries": len(questions),
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        f"recall@{k}": float(np.mean(recalls)),
+        "reference_doc_seconds": ref["doc_seconds"],
+        "candidate_doc_seconds": cand["doc_seconds"],
+        "reference_query_ms": ref["query_seconds"] / len(questions) * 1000,
+        "candidate_query_ms": cand["query_seconds"] / len(questions) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check an embedding backend against the PyTorch embeddings")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="onnx-int8",
+                        help="Backend to check (default: %(default)s)")
+    parser.add_argument("--k", type=int, default=10, help="Cutoff for recall@k (default: %(default)s)")
+    parser.add_argument("--min-cosine", type=float, default=0.99,
+                        help="Fail if mean cosine agreement is below this (default: %(default)s)")
+    parser.add_argument("--min-recall", type=float, default=0.9,
+                        help="Fail if recall@k is below this (default: %(default)s)")
+    parser.add_argument("--data-path", default="app/data")
+    args = parser.parse_args()
+    
+    report = check_parity(args.backend, data_path=args.data_path, k=args.k)
+    recall_key = next(key for key in report if key.startswith("recall@"))
+    
+    print(f"\n{'='*60}")
+    print(f"Parity: {report['candidate']} vs {report['reference']}")
+    print(f"{'='*60}")
+    print(f"Chunks:           {report['chunks']}")
+    print(f"Cosine (mean):    {report['cosine_mean']:.4f}")
+    print(f"Cosine (min):     {report['cosine_min']:.4f}")
+    print(f"{recall_key + ':':<18}{report[recall_key]:.3f}")
+    print(f"Corpus embedding: {report['reference_doc_seconds']:.1f}s -> {report['candidate_doc_seconds']:.1f}s")
+    print(f"Query embedding:  {report['reference_query_ms']:.1f}ms -> {report['candidate_query_ms']:.1f}ms")
+    
+    if report["cosine_mean"] < args.min_cosine or report[recall_key] < args.min_recall:
+        print("\n❌ Parity check failed")
+        raise SystemExit(1)
+    print("\n✅ Parity check passed")
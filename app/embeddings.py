@@ -0,0 +1,143 @@
+import os
+import platform
+
+from metrics import status
+
+# Embedding model shared by indexing and querying
+EMBEDDING_MODEL = 'all-mpnet-base-v2'
+
+# Available backends:
+#   torch      - PyTorch forward pass (original behaviour)
+#   onnx       - model exported to ONNX, run with ONNX Runtime
+#   onnx-int8  - ONNX export with int8 dynamic quantization
+EMBEDDING_BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+# Backend used when none is given and the index doesn't record one
+DEFAULT_BACKEND = os.environ.get("BOOKWORM_EMBEDDING_BACKEND", "torch")
+
+# Where exported ONNX models are cached
+ONNX_MODEL_DIR = os.environ.get("BOOKWORM_MODEL_DIR", "./models")
+
+
+def quantization_config():
+    """Pick the ONNX Runtime dynamic quantization config for this CPU"""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    return os.environ.get("BOOKWORM_ONNX_QUANTIZATION", "avx2")
+
+
+def load_embedding_model(backend=None, model_name=EMBEDDING_MODEL):
+    """
+    Load the embedding model for the given backend
+    
+    The ONNX export (and its quantized variant) is created once under
+    ONNX_MODEL_DIR and reused on later runs.
+    
+    Args:
+        backend: One of EMBEDDING_BACKENDS (defaults to DEFAULT_BACKEND)
+        model_name: Sentence-transformers model to load
+    
+    Returns:
+        A SentenceTransformer whose encode() returns normalized embeddings
+    """
+    from sentence_transformers import SentenceTransformer
+    
+    backend = backend or DEFAULT_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Choose from: {', '.join(EMBEDDING_BACKENDS)}")
+    
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    
+    export_dir = os.path.join(ONNX_MODEL_DIR, f"{model_name}-onnx")
+    if not os.path.isdir(export_dir):
+        status(f"Exporting {model_name} to ONNX (first run only)...")
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save(export_dir)
+        status(f"✅ Saved ONNX model to {export_dir}")
+    
+    if backend == "onnx":
+        return SentenceTransformer(export_dir, backend="onnx")
+    
+    # onnx-int8: dynamic quantization of the exported model
+    config = quantization_config()
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        
+        status(f"Quantizing ONNX model to int8 ({config})...")
+        export_dynamic_quantized_onnx_model(
+            SentenceTransformer(export_dir, backend="onnx"),
+            config,
+            export_dir
+        )
+        status(f"✅ Saved quantized model to {os.path.join(export_dir, file_name)}")
+    
+    return SentenceTransformer(export_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def embedding_metadata(backend, model_name=EMBEDDING_MODEL):
+    """Collection metadata recording how the index was embedded"""
+    metadata = {
+        "embedding_model": model_name,
+        "embedding_backend": backend,
+    }
+    if backend == "onnx-int8":
+        # int8 embeddings differ between quantization configs
+        metadata["embedding_quantization"] = quantization_config()
+    return metadata
+
+
+def check_quantization(recorded, source="Index"):
+    """
+    Check that int8 embeddings were quantized the way this host quantizes queries
+    
+    Args:
+        recorded: Quantization config stored with the embeddings (None if
+            not recorded, e.g. indexes built before it was stored)
+        source: What the embeddings came from, for the error message
+    
+    Raises:
+        ValueError: If the recorded config differs from quantization_config()
+    """
+    current = quantization_config()
+    if recorded and recorded != current:
+        raise ValueError(
+            f"{source} was quantized with the '{recorded}' config but this host uses '{current}'. "
+            "Re-index on this host with: python3 app/load_to_vectordb.py --backend onnx-int8"
+        )
+
+
+def resolve_backend(collection_metadata, backend=None):
+    """
+    Choose the query-time backend for an index
+    
+    Args:
+        collection_metadata: Metadata of the collection being queried
+        backend: Backend explicitly requested by the caller, if any
+    
+    Returns:
+        The backend recorded in the index (indexes built before backends
+        existed are treated as torch)
+    
+    Raises:
+        ValueError: If the requested backend, model or int8 quantization
+            config doesn't match the index
+    """
+    metadata = collection_metadata or {}
+    index_model = metadata.get("embedding_model", EMBEDDING_MODEL)
+    index_backend = metadata.get("embedding_backend", "torch")
+    
+    if index_model != EMBEDDING_MODEL:
+        raise ValueError(
+            f"Index was built with '{index_model}' but queries use '{EMBEDDING_MODEL}'. "
+            "Re-index with: python3 app/load_to_vectordb.py"
+        )
+    if backend and backend != index_backend:
+        raise ValueError(
+            f"Index was embedded with the '{index_backend}' backend but '{backend}' was requested. "
+            f"Re-index with: python3 app/load_to_vectordb.py --backend {backend}"
+        )
+    if index_backend == "onnx-int8":
+        check_quantization(metadata.get("embedding_quantization"))
+    return index_backend
@@ -0,0 +1,292 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import contextlib
+
+import metrics
+from process_data import merge_chunks_by_section
+from load_to_vectordb import load_data_to_chromadb, load_data_to_numpy_store
+from embeddings import EMBEDDING_BACKENDS, DEFAULT_BACKEND
+from vector_store import VECTOR_STORES, DEFAULT_VECTOR_STORE
+from benchmark import summarize
+
+GOLD_PATH = "app/eval_questions.json"
+
+DEFAULT_N_RESULTS = [3, 5, 7, 10, 12, 15]
+DEFAULT_CHUNK_WORDS = [150, 250, 400]
+
+# dense:  no filter, like query.py without --series
+# series: filtered to the question's series, like ask() with a series selected
+# dedup:  series filter, over-fetched, keeping the best chunk per (name, section)
+# rerank: series filter, candidates reordered by the cross-encoder (reranker.py)
+RETRIEVAL_MODES = ["dense", "series", "dedup", "rerank"]
+DEDUP_OVERFETCH = 3
+
+
+def load_gold(path=GOLD_PATH):
+    """
+    Read the gold question set
+    
+    Returns:
+        List of {"question", "series", "expected"} where expected is a set of
+        (name, section) pairs a good retrieval should return
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    return [
+        {
+            "question": entry["question"],
+            "series": entry.get("series"),
+            "expected": {(e["name"], e["section"]) for e in entry["expected"]},
+        }
+        for entry in entries
+    ]
+
+
+def rechunk_corpus(data_path, output_path, max_words):
+    """
+    Re-split the processed corpus with a different chunk size
+    
+    Chunks of each file are regrouped by section and passed through
+    merge_chunks_by_section again, so the result matches what
+    process_data.py would have written with that max_words.
+    
+    Returns:
+        Number of chunks written
+    """
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    
+    total = 0
+    for series_name in sorted(os.listdir(data_path)):
+        series_path = os.path.join(data_path, series_name)
+        if not os.path.isdir(series_path):
+            continue
+        for doc_type in sorted(os.listdir(series_path)):
+            type_path = os.path.join(series_path, doc_type)
+            if not os.path.isdir(type_path):
+                continue
+            for filename in sorted(os.listdir(type_path)):
+                if not filename.endswith('.json'):
+                    continue
+                with open(os.path.join(type_path, filename), 'r', encoding='utf-8') as f:
+                    chunks = json.load(f)
+                if not chunks:
+                    continue
+                
+                first = chunks[0]
+                sections = [{'text': c.get('text', ''), 'section': c.get('section', '')} for c in chunks]
+                merged = merge_chunks_by_section(sections, first.get('name', ''), first.get('type', doc_type),
+                                                 first.get('series', series_name), max_words=max_words)
+                
+                out_path = os.path.join(output_path, series_name, doc_type)
+                os.makedirs(out_path, exist_ok=True)
+                with open(os.path.join(out_path, filename), 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, ensure_ascii=False)
+                total += len(merged)
+    return total
+
+
+_reranker = None
+
+
+def _get_reranker():
+    global _reranker
+    if _reranker is None:
+        from reranker import Reranker
+        _reranker = Reranker()
+    return _reranker
+
+
+def retrieve(rag, question, series, mode, n_results):
+    """Context chunks for one question in one retrieval mode"""
+    if mode == "dense":
+        return rag.getRelevantContext(question, None, n_results)
+    if mode == "series":
+        return rag.getRelevantContext(question, series, n_results)
+    if mode == "dedup":
+        chunks = rag.getRelevantContext(question, series, n_results * DEDUP_OVERFETCH)
+        seen = set()
+        kept = []
+        for chunk in chunks:
+            key = (chunk['name'], chunk['section'])
+            if key not in seen:
+                seen.add(key)
+                kept.append(chunk)
+        return kept[:n_results]
+    if mode == "rerank":
+        reranker = _get_reranker()
+        chunks = rag.getRelevantContext(question, series, max(n_results, reranker.candidates))
+        chunks, _ = reranker.rerank(question, chunks, top_k=n_results, dense_k=n_results,
+                                    version=getattr(rag.collection, "version", None))
+        return chunks
+    raise ValueError(f"Unknown retrieval mode '{mode}'. Choose from: {', '.join(RETRIEVAL_MODES)}")
+
+
+def score(chunks, expected):
+    """
+    Recall and reciprocal rank of one retrieval
+    
+    Returns:
+        (recall, reciprocal_rank) - recall is the share of expected
+        (name, section) pairs found; reciprocal rank is 1/position of
+        the first chunk from an expected pair (0 if none). A merged
+        near-duplicate counts for every source it stands in for.
+    """
+    found = {source for c in chunks for source in c['sources']}
+    recall = len(found & expected) / len(expected) if expected else 0.0
+    for rank, chunk in enumerate(chunks, 1):
+        if expected.intersection(chunk['sources']):
+            return recall, 1.0 / rank
+    return recall, 0.0
+
+
+def evaluate_index(rag, gold, n_results_values, modes):
+    """
+    Run every gold question through each (mode, n_results) configuration
+    
+    Returns:
+        List of result rows with recall@k, MRR, prompt/context tokens and
+        retrieval latency
+    """
+    # Warm up the embedding model and the index
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag.getRelevantContext(gold[0]["question"], None, 1)
+    
+    rows = []
+    for mode in modes:
+        for n_results in n_results_values:
+            recalls, reciprocal_ranks, latencies = [], [], []
+            prompt_tokens, context_tokens, chunk_counts = [], [], []
+            for entry in gold:
+                # Cached scores from an earlier row would make its latency
+                # and budget fallbacks incomparable
+                if mode == "rerank":
+                    _get_reranker().clear_cache()
+                start = time.perf_counter()
+                chunks = retrieve(rag, entry["question"], entry["series"], mode, n_results)
+                latencies.append(time.perf_counter() - start)
+                
+                recall, reciprocal_rank = score(chunks, entry["expected"])
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+                chunk_counts.append(len(chunks))
+                context_tokens.append(metrics.count_tokens(rag.formatContext(chunks)))
+                prompt_tokens.append(metrics.count_tokens(rag.buildPrompt(entry["question"], chunks)))
+            
+            rows.append({
+                "mode": mode,
+                "n_results": n_results,
+                "recall": sum(recalls) / len(recalls),
+                "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+                "chunks": sum(chunk_counts) / len(chunk_counts),
+                "context_tokens": sum(context_tokens) / len(context_tokens),
+                "prompt_tokens": sum(prompt_tokens) / len(prompt_tokens),
+                "latency": summarize(latencies),
+            })
+    return rows
+
+
+def print_rows(rows):
+    print(f"  {'mode':8}{'k':>4}{'recall@k':>10}{'MRR':>8}{'chunks':>8}{'prompt tok':>12}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in rows:
+        print(f"  {row['mode']:8}{row['n_results']:>4}{row['recall']:>10.3f}{row['mrr']:>8.3f}{row['chunks']:>8.1f}"
+              f"{row['prompt_tokens']:>12.0f}{row['latency']['p50_ms']:>9.1f}{row['latency']['p95_ms']:>9.1f}")
+
+
+def recommend(results, max_recall_drop):
+    """
+    Cheapest configuration (by prompt tokens) whose recall is within
+    max_recall_drop of the best one
+    """
+    candidates = [(chunk_words, row) for chunk_words, result in results.items() for row in result["rows"]]
+    best_recall = max(row["recall"] for _, row in candidates)
+    good_enough = [c for c in candidates if c[1]["recall"] >= best_recall - max_recall_drop]
+    chunk_words, row = min(good_enough, key=lambda c: (c[1]["prompt_tokens"], -c[1]["mrr"]))
+    return {"chunk_words": chunk_words, "best_recall": best_recall, **row}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval evaluation: recall@k, MRR, prompt tokens and latency")
+    parser.add_argument("--gold", default=GOLD_PATH, help="Gold questions JSON (default: %(default)s)")
+    parser.add_argument("--data-path", default="app/data", help="Processed corpus to re-chunk")
+    parser.add_argument("--n-results", default=",".join(map(str, DEFAULT_N_RESULTS)),
+                        help="Comma-separated n_results values (default: %(default)s)")
+    parser.add_argument("--chunk-words", default=",".join(map(str, DEFAULT_CHUNK_WORDS)),
+                        help="Comma-separated max_words chunk sizes (default: %(default)s)")
+    parser.add_argument("--modes", default=",".join(RETRIEVAL_MODES),
+                        help="Comma-separated retrieval modes (default: %(default)s)")
+    parser.add_argument("--live", action="store_true",
+                        help="Evaluate the current index instead of re-chunking and re-indexing")
+    parser.add_argument("--store", choices=VECTOR_STORES, default=DEFAULT_VECTOR_STORE)
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--max-recall-drop", type=float, default=0.02,
+                        help="Recall the recommended configuration may give up for a smaller prompt")
+    parser.add_argument("--work-dir", default="bench_data/retrieval_eval", help="Where re-chunked corpora and indexes are written")
+    parser.add_argument("--output", help="Results JSON (default: bench_results/retrieval-eval-<timestamp>.json)")
+    args = parser.parse_args()
+    
+    from ollama_chat import BookWormOllamaRAG
+    
+    gold = load_gold(args.gold)
+    n_results_values = [int(k) for k in args.n_results.split(",") if k.strip()]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    for mode in modes:
+        if mode not in RETRIEVAL_MODES:
+            parser.error(f"Unknown retrieval mode '{mode}'. Choose from: {', '.join(RETRIEVAL_MODES)}")
+    chunk_sizes = ["live"] if args.live else [int(w) for w in args.chunk_words.split(",") if w.strip()]
+    
+    report = {
+        "created_at": time.time(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "questions": len(gold),
+        "results": {},
+    }
+    for chunk_words in chunk_sizes:
+        print(f"\n{'='*80}")
+        print(f"Chunk size: {chunk_words if chunk_words == 'live' else f'{chunk_words} words'}")
+        print(f"{'='*80}")
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            if chunk_words == "live":
+                n_chunks = None
+                rag = BookWormOllamaRAG(embedding_backend=args.backend, vector_store=args.store, rerank=False)
+            else:
+                size_dir = os.path.join(args.work_dir, str(chunk_words))
+                corpus_path = os.path.join(size_dir, "data")
+                index_path = os.path.join(size_dir, "index")
+                n_chunks = rechunk_corpus(args.data_path, corpus_path, chunk_words)
+                if args.store == "numpy":
+                    load_data_to_numpy_store(data_path=corpus_path, store_path=index_path, backend=args.backend, grace_seconds=0)
+                else:
+                    load_data_to_chromadb(data_path=corpus_path, backend=args.backend, db_path=index_path, grace_seconds=0)
+                rag = BookWormOllamaRAG(embedding_backend=args.backend, vector_store=args.store, index_path=index_path,
+                                        rerank=False)
+        
+        n_chunks = n_chunks or rag.collection.count()
+        print(f"  {n_chunks} chunks, {len(gold)} questions")
+        rows = evaluate_index(rag, gold, n_results_values, modes)
+        print_rows(rows)
+        report["results"][str(chunk_words)] = {"chunks": n_chunks, "rows": rows}
+    
+    best = recommend(report["results"], args.max_recall_drop)
+    report["recommended"] = best
+    print(f"\n{'='*80}")
+    print(f"Smallest context within {args.max_recall_drop:.2f} of the best recall ({best['best_recall']:.3f}):")
+    print(f"  chunk size {best['chunk_words']}, mode {best['mode']}, n_results={best['n_results']}: "
+          f"recall {best['recall']:.3f}, MRR {best['mrr']:.3f}, ~{best['prompt_tokens']:.0f} prompt tokens")
+    print(f"{'='*80}")
+    
+    output = args.output or os.path.join("bench_results", f"retrieval-eval-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Saved results to {output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
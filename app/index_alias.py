@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import time
+import calendar
+
+from metrics import status
+
+# How long a replaced index version is kept before it can be deleted, so
+# readers that resolved it just before the flip can finish their queries
+GRACE_SECONDS = int(os.environ.get("BOOKWORM_INDEX_GRACE_SECONDS", "3600"))
+
+
+def alias_path(root, alias):
+    """Path of the pointer file for an alias"""
+    return os.path.join(root, f"{alias}.alias.json")
+
+
+def new_version_name(alias):
+    """Name for a new index version, e.g. book_worm_v20251123T122554_123"""
+    now = time.time()
+    return f"{alias}_v{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}_{int(now * 1000) % 1000:03d}"
+
+
+def version_created_at(alias, name):
+    """
+    Creation time encoded in a version name from new_version_name()
+    
+    Returns:
+        Seconds since the epoch, or None if name isn't a version of alias
+    """
+    match = re.fullmatch(re.escape(alias) + r"_v(\d{8}T\d{6})_(\d{3})", name)
+    if not match:
+        return None
+    return calendar.timegm(time.strptime(match.group(1), "%Y%m%dT%H%M%S")) + int(match.group(2)) / 1000
+
+
+def read_alias(root, alias):
+    """
+    Read an alias pointer
+    
+    Returns:
+        Dict with "current" (version name), "updated_at" and "retired"
+        (list of {"name", "retired_at"}), or None if the alias doesn't exist
+    """
+    try:
+        with open(alias_path(root, alias), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def current_version(root, alias):
+    """Version the alias points to, or None if it hasn't been created"""
+    pointer = read_alias(root, alias)
+    return pointer["current"] if pointer else None
+
+
+def alias_stamp(root, alias):
+    """Cheap change marker for an alias (readers compare it before each query)"""
+    try:
+        stat = os.stat(alias_path(root, alias))
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _write_alias(root, alias, pointer):
+    # Write to a temp file and rename so readers never see a partial pointer
+    os.makedirs(root, exist_ok=True)
+    path = alias_path(root, alias)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def flip_alias(root, alias, version, previous=None):
+    """
+    Atomically point an alias at a new version
+    
+    Args:
+        root: Directory holding the pointer file
+        alias: Alias readers resolve (e.g., "book_worm")
+        version: Version to make current
+        previous: Version being replaced when the alias doesn't exist yet
+            (e.g., a collection built before aliases were introduced)
+    
+    Returns:
+        The new pointer dict
+    """
+    pointer = read_alias(root, alias) or {"current": previous, "retired": []}
+    now = time.time()
+    retired = pointer.get("retired", [])
+    if pointer.get("current") and pointer["current"] != version:
+        retired.append({"name": pointer["current"], "retired_at": now})
+    
+    new_pointer = {
+        "current": version,
+        "updated_at": now,
+        "retired": [r for r in retired if r["name"] != version],
+    }
+    _write_alias(root, alias, new_pointer)
+    return new_pointer
+
+
+def collect_expired(root, alias, delete_version, grace_seconds=GRACE_SECONDS):
+    """
+    Delete retired versions older than the grace period
+    
+    Args:
+        root: Directory holding the pointer file
+        alias: Alias whose retired versions to collect
+        delete_version: Callable that removes one version by name
+        grace_seconds: Minimum time a version stays after being retired
+    
+    Returns:
+        Names of the deleted versions
+    """
+    pointer = read_alias(root, alias)
+    if not pointer:
+        return []
+    
+    now = time.time()
+    deleted = []
+    for entry in pointer.get("retired", []):
+        if now - entry["retired_at"] < grace_seconds:
+            continue
+        try:
+            delete_version(entry["name"])
+            deleted.append(entry["name"])
+            status(f"Removed old index version: {entry['name']}")
+        except Exception as e:
+            print(f"⚠️  Could not remove {entry['name']}: {e}")
+    
+    if deleted:
+        # Re-read so a flip that happened meanwhile isn't overwritten
+        pointer = read_alias(root, alias)
+        pointer["retired"] = [r for r in pointer.get("retired", []) if r["name"] not in deleted]
+        _write_alias(root, alias, pointer)
+    return deleted
+
+
+def collect_abandoned(root, alias, versions, delete_version, grace_seconds=GRACE_SECONDS):
+    """
+    Delete versions that were never published and are older than the grace period
+    
+    A build that is killed or interrupted before the alias flips leaves its
+    version behind without it ever being current or retired, so
+    collect_expired() would never see it. Builds still running are younger
+    than the grace period and are left alone.
+    
+    Args:
+        root: Directory holding the pointer file
+        alias: Alias whose versions to check
+        versions: Names of the versions that exist in the store
+        delete_version: Callable that removes one version by name
+        grace_seconds: Minimum age of a version before it is deleted
+    
+    Returns:
+        Names of the deleted versions
+    """
+    pointer = read_alias(root, alias)
+    if not pointer:
+        return []
+    
+    known = {pointer.get("current")} | {r["name"] for r in pointer.get("retired", [])}
+    now = time.time()
+    deleted = []
+    for name in sorted(versions):
+        created_at = version_created_at(alias, name)
+        if name in known or created_at is None or now - created_at < grace_seconds:
+            continue
+        try:
+            delete_version(name)
+            deleted.append(name)
+            status(f"Removed abandoned index version: {name}")
+        except Exception as e:
+            print(f"⚠️  Could not remove {name}: {e}")
+    return deleted
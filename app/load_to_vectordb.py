@@ -1,79 +1,41 @@
 import os
+import re
 import json
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-from chromadb import Documents, EmbeddingFunction, Embeddings
+import argparse
 
-def load_data_to_chromadb(data_path="app/data", collection_name="book_worm"):
+import metrics
+from metrics import status, span
+from embeddings import EMBEDDING_BACKENDS, DEFAULT_BACKEND, EMBEDDING_MODEL, load_embedding_model, embedding_metadata
+from vector_store import VECTOR_STORES, DEFAULT_VECTOR_STORE, STORE_DTYPES, CHROMA_PATH, NUMPY_STORE_PATH, build_numpy_store
+from index_alias import GRACE_SECONDS, new_version_name, current_version, flip_alias, collect_expired, collect_abandoned
+from dedup import DEDUP_THRESHOLD, find_duplicate_clusters
+
+# Number of smoke queries run against a new index before it goes live
+SMOKE_SAMPLES = 5
+
+# ChromaDB keeps each HNSW segment in a folder named after the segment's UUID
+_SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def load_documents(data_path="app/data", dedup_threshold=DEDUP_THRESHOLD):
     """
-    Load all JSON chunks from the data directory into ChromaDB
+    Read all JSON chunks from the data directory
     
     Args:
         data_path: Path to the data directory containing series folders
-        collection_name: Name of the ChromaDB collection to create/use
-    """
-    # Initialize ChromaDB client
-    # This creates a persistent database in the ./chroma_db folder
-    client = chromadb.PersistentClient(path="./chroma_db")
-    
-    # Delete existing collection if it exists for fresh start
-    try:
-        client.delete_collection(name=collection_name)
-        print(f"Deleted existing collection: {collection_name}")
-    except ValueError as e:
-        if "does not exist" in str(e).lower():
-            print(f"Collection '{collection_name}' doesn't exist yet (first run)")
-        else:
-            print(f"⚠️  Error deleting collection: {e}")
-    except Exception as e:
-        print(f"⚠️  Error deleting collection: {e}")
-    
-    # Force cleanup of old data
-    print("Forcing cleanup of old vector database files...")
-    import shutil
-    import os
-    
-    # Remove old chroma folders
-    chroma_path = "./chroma_db"
-    if os.path.exists(chroma_path):
-        for item in os.listdir(chroma_path):
-            item_path = os.path.join(chroma_path, item)
-            if os.path.isdir(item_path) and len(item) == 36:  # UUID folders
-                try:
-                    shutil.rmtree(item_path)
-                    print(f"Removed old database folder: {item}")
-                except Exception as e:
-                    print(f"⚠️  Could not remove {item}: {e}")
+        dedup_threshold: Similarity at which chunks are merged as
+            near-duplicates (0 keeps every chunk)
     
-    # Recreate client to ensure clean state
-    client = chromadb.PersistentClient(path="./chroma_db")
-    
-    # Load high-quality embedding model
-    print("Loading embedding model...")
-    model = SentenceTransformer('all-mpnet-base-v2')
-    print("✅ Model loaded: all-mpnet-base-v2 (768 dimensions)")
-    
-    # Create collection with custom embedding function
-    class CustomEmbeddingFunction(EmbeddingFunction):
-        def __call__(self, input: Documents) -> Embeddings:
-            return model.encode(input).tolist()
-    
-    # Get or create collection
-    # Using cosine similarity for semantic search
-    collection = client.create_collection(
-        name=collection_name,
-        metadata={"hnsw:space": "cosine"},
-        embedding_function=CustomEmbeddingFunction()
-    )
-    
-    print(f"Loading data into ChromaDB collection: {collection_name}")
-    print(f"{'='*60}\n")
-    
-    total_chunks = 0
+    Returns:
+        (documents, metadatas, ids) - documents carry the contextual header
+        used for embedding, metadatas hold series/type/name/section and
+        sources/source_count
+    """
     documents = []
     metadatas = []
     ids = []
+    texts = []
+    files_loaded = 0
     
     # Walk through all series folders
     for series_name in os.listdir(data_path):
@@ -81,8 +43,8 @@ def load_data_to_chromadb(data_path="app/data", collection_name="book_worm"):
         
         if not os.path.isdir(series_path):
             continue
-            
-        print(f"Processing series: {series_name}")
+        
+        status(f"Processing series: {series_name}")
         
         # Walk through types (books, characters, etc.)
         for doc_type in os.listdir(series_path):
@@ -95,7 +57,7 @@ def load_data_to_chromadb(data_path="app/data", collection_name="book_worm"):
             for filename in os.listdir(type_path):
                 if not filename.endswith('.json'):
                     continue
-                    
+                
                 filepath = os.path.join(type_path, filename)
                 
                 try:
@@ -143,41 +105,446 @@ def load_data_to_chromadb(data_path="app/data", collection_name="book_worm"):
                         documents.append(enhanced_text)
                         metadatas.append(metadata)
                         ids.append(chunk_id)
-                        total_chunks += 1
-                    
-                    print(f"  ✅ {filename}: {len(chunks)} chunks")
+                        texts.append(text)
                     
+                    files_loaded += 1
+                    status(f"  ✅ {filename}: {len(chunks)} chunks", level=2)
+                
                 except Exception as e:
+                    metrics.increment("ingest_file_errors_total")
                     print(f"  ❌ Error loading {filename}: {e}")
         
-        print()  # Empty line between series
+        status("")  # Empty line between series
     
-    # Add all documents to ChromaDB in one batch
-    if documents:
-        print(f"\n{'='*60}")
-        print(f"Adding {total_chunks} chunks to ChromaDB...")
+    metrics.increment("ingest_files_total", files_loaded)
+    metrics.increment("ingest_chunks_read_total", len(documents))
+    metrics.log_event("documents_loaded", data_path=data_path, files=files_loaded, chunks=len(documents))
+    
+    for metadata in metadatas:
+        metadata['sources'] = ''
+        metadata['source_count'] = 1
+    if dedup_threshold and documents:
+        with span("dedup", chunks=len(documents)):
+            documents, metadatas, ids = merge_near_duplicates(texts, documents, metadatas, ids, dedup_threshold)
+    return documents, metadatas, ids
+
+
+def merge_near_duplicates(texts, documents, metadatas, ids, threshold=DEDUP_THRESHOLD):
+    """
+    Keep one copy of each group of near-duplicate chunks
+    
+    Each group of near-duplicate chunks of the same series (MinHash/LSH,
+    see dedup.py) is replaced by its longest member; a chunk is only dropped
+    if it is a near-duplicate of that member itself. Its metadata lists
+    every source as a JSON string of [name, section] pairs in "sources"
+    (ChromaDB metadata must be scalar), with their number in "source_count".
+    The other entities are added to its contextual header so a query about
+    any of them still finds it.
+    
+    Args:
+        texts: Raw chunk texts, compared without the contextual header
+        documents: Enhanced texts (header + text)
+        metadatas: Chunk metadata dicts
+        ids: Chunk IDs
+        threshold: Minimum estimated Jaccard similarity
+    
+    Returns:
+        (documents, metadatas, ids) with the duplicates removed
+    """
+    clusters = find_duplicate_clusters(texts, groups=[m['series'] for m in metadatas], threshold=threshold)
+    dropped = set()
+    for cluster in clusters:
+        canonical = cluster[0]
+        sources = []
+        for i in cluster:
+            pair = [metadatas[i]['name'], metadatas[i]['section']]
+            if pair not in sources:
+                sources.append(pair)
+        metadatas[canonical]['sources'] = json.dumps(sources, ensure_ascii=False)
+        metadatas[canonical]['source_count'] = len(sources)
         
+        also = []
+        for name, _ in sources[1:]:
+            if name != metadatas[canonical]['name'] and name not in also:
+                also.append(name)
+        if also:
+            text = texts[canonical]
+            header = documents[canonical][:len(documents[canonical]) - len(text)] if text else documents[canonical]
+            header = header[:-2] if header.endswith("\n\n") else header
+            header = f"{header} | Also about: {', '.join(also)}" if header else f"Also about: {', '.join(also)}"
+            documents[canonical] = f"{header}\n\n{text}"
+        dropped.update(cluster[1:])
+    
+    before_words = sum(len(t.split()) for t in texts)
+    kept = [i for i in range(len(documents)) if i not in dropped]
+    after_words = sum(len(texts[i].split()) for i in kept)
+    shrink = len(dropped) / len(documents) * 100 if documents else 0.0
+    status(f"Near-duplicates: {len(documents)} -> {len(kept)} chunks ({shrink:.1f}% smaller, "
+           f"{before_words - after_words} words) in {len(clusters)} groups")
+    metrics.increment("chunks_deduplicated_total", len(dropped))
+    metrics.log_event("deduplicated", chunks_before=len(documents), chunks_after=len(kept),
+                      groups=len(clusters), words_before=before_words, words_after=after_words)
+    return [documents[i] for i in kept], [metadatas[i] for i in kept], [ids[i] for i in kept]
+
+
+def validate_index(collection, ids, embed_rows, samples=SMOKE_SAMPLES):
+    """
+    Check a freshly built index before readers are switched to it
+    
+    Args:
+        collection: The new ChromaDB collection or NumpyVectorStore
+        ids: Chunk IDs that were added, in order
+        embed_rows: Callable returning query embeddings for a list of row
+            indices (re-encodes the documents, or reuses stored vectors)
+        samples: Number of smoke queries to run
+    
+    Raises:
+        RuntimeError: If the chunk count is wrong or a smoke query fails
+    """
+    with span("validate_index"):
+        _check_index(collection, ids, embed_rows, samples)
+
+
+def _check_index(collection, ids, embed_rows, samples):
+    count = collection.count()
+    if count != len(ids):
+        raise RuntimeError(f"Index has {count} chunks, expected {len(ids)}")
+    
+    # Smoke queries: sampled chunks must retrieve themselves
+    step = max(1, len(ids) // samples)
+    sample = list(range(0, len(ids), step))[:samples]
+    query_embeddings = [list(map(float, v)) for v in embed_rows(sample)]
+    results = collection.query(query_embeddings=query_embeddings, n_results=10)
+    missing = [ids[i] for i, found in zip(sample, results['ids']) if ids[i] not in found]
+    if missing:
+        raise RuntimeError(f"Smoke queries did not retrieve: {', '.join(missing)}")
+    
+    status(f"✅ Validated index: {count} chunks, {len(sample)} smoke queries passed")
+
+
+def remove_orphaned_segments(db_path=CHROMA_PATH):
+    """
+    Delete segment folders that ChromaDB no longer references
+    
+    delete_collection() drops a collection from the sysdb (chroma.sqlite3)
+    but leaves its HNSW segment folder on disk, so every retired version
+    would otherwise keep its vectors around.
+    
+    Args:
+        db_path: ChromaDB directory
+    
+    Returns:
+        Names of the removed folders
+    """
+    import shutil
+    import sqlite3
+    from contextlib import closing
+    
+    sysdb_path = os.path.join(db_path, "chroma.sqlite3")
+    if not os.path.exists(sysdb_path):
+        return []
+    # A new segment is registered here before its folder is written, so an
+    # unreferenced folder can't belong to a build that is still running
+    with closing(sqlite3.connect(sysdb_path)) as conn:
+        referenced = {row[0] for row in conn.execute("SELECT id FROM segments")}
+    
+    removed = []
+    for entry in sorted(os.listdir(db_path)):
+        entry_path = os.path.join(db_path, entry)
+        if not _SEGMENT_DIR.match(entry) or entry in referenced or not os.path.isdir(entry_path):
+            continue
+        try:
+            shutil.rmtree(entry_path)
+            removed.append(entry)
+        except OSError as e:
+            print(f"⚠️  Could not remove segment folder {entry}: {e}")
+    if removed:
+        status(f"Removed {len(removed)} orphaned segment folder(s) from {db_path}")
+    return removed
+
+
+def publish_chromadb_version(client, db_path, collection_name, version, collection_metadata, ids, documents,
+                             metadatas, embed_rows, embeddings=None, embedding_function=None, batch_size=100,
+                             grace_seconds=GRACE_SECONDS):
+    """
+    Build a new ChromaDB index version and point the alias at it
+    
+    The version is created next to the live one, filled in batches and
+    validated; only then is the alias flipped. A failed build is deleted and
+    readers stay on the previous version, also when the build is
+    interrupted. Retired versions older than grace_seconds, versions left
+    by builds that never finished, and their segment folders are removed
+    afterwards.
+    
+    Args:
+        client: chromadb.PersistentClient for db_path
+        db_path: ChromaDB directory (holds the alias file)
+        collection_name: Alias that readers resolve
+        version: Name of the new collection
+        collection_metadata: Embedding model/backend metadata to record
+        ids, documents, metadatas: Chunks to add
+        embed_rows: Callable returning query embeddings for a list of row
+            indices (used by validate_index)
+        embeddings: Precomputed embeddings; without them embedding_function
+            embeds the documents as they are added
+        embedding_function: ChromaDB embedding function for the collection
+        batch_size: Chunks per add() call
+        grace_seconds: How long to keep replaced versions
+    
+    Returns:
+        The new collection
+    """
+    # A collection built before aliases existed is the version being replaced
+    previous = None
+    if current_version(db_path, collection_name) is None:
+        try:
+            client.get_collection(name=collection_name)
+            previous = collection_name
+        except Exception:
+            pass
+    
+    # Build into a new version; readers stay on the current one meanwhile
+    # Using cosine similarity for semantic search
+    collection = client.create_collection(
+        name=version,
+        metadata={"hnsw:space": "cosine", "alias": collection_name, **collection_metadata},
+        embedding_function=embedding_function
+    )
+    
+    status(f"\n{'='*60}")
+    status(f"Adding {len(ids)} chunks to ChromaDB...")
+    
+    # Cleaned up in finally so Ctrl-C during a long build doesn't leave it behind
+    built = False
+    try:
         # ChromaDB has a batch size limit, so we'll add in batches
-        batch_size = 100  # Smaller batches for custom embedding function
-        for i in range(0, len(documents), batch_size):
-            end_idx = min(i + batch_size, len(documents))
-            print(f"  Processing batch {i//batch_size + 1}/{(len(documents)-1)//batch_size + 1}...")
+        for i in range(0, len(ids), batch_size):
+            end_idx = min(i + batch_size, len(ids))
+            status(f"  Processing batch {i//batch_size + 1}/{(len(ids)-1)//batch_size + 1}...", level=2)
             
-            collection.add(
-                documents=documents[i:end_idx],
-                metadatas=metadatas[i:end_idx],
-                ids=ids[i:end_idx]
-            )
+            with span("index_batch", chunks=end_idx - i):
+                collection.add(
+                    documents=documents[i:end_idx],
+                    metadatas=metadatas[i:end_idx],
+                    ids=ids[i:end_idx],
+                    embeddings=embeddings[i:end_idx].tolist() if embeddings is not None else None
+                )
+            metrics.increment("chunks_indexed_total", end_idx - i, store="chroma")
         
-        print(f"\n✅ Successfully loaded {total_chunks} chunks into ChromaDB")
-        print(f"{'='*60}")
+        validate_index(collection, ids, embed_rows)
+        built = True
+    finally:
+        if not built:
+            # Never point readers at a partial index
+            client.delete_collection(name=version)
+            print(f"❌ Build failed, {collection_name} still points at the previous version")
+    
+    flip_alias(db_path, collection_name, version, previous=previous)
+    status(f"\n✅ Successfully loaded {len(ids)} chunks into ChromaDB")
+    status(f"✅ {collection_name} -> {version}")
+    status(f"{'='*60}")
+    
+    collect_expired(db_path, collection_name, lambda name: client.delete_collection(name=name), grace_seconds)
+    collect_abandoned(db_path, collection_name, [c.name for c in client.list_collections()],
+                      lambda name: client.delete_collection(name=name), grace_seconds)
+    remove_orphaned_segments(db_path)
+    return collection
 
-    else:
+
+def publish_numpy_version(store_path, collection_name, version, collection_metadata, ids, documents, metadatas,
+                          embeddings, dtype="float16", grace_seconds=GRACE_SECONDS):
+    """
+    Build a new NumpyVectorStore version and point the alias at it
+    
+    Same sequence as publish_chromadb_version: write, validate, flip the
+    alias, then remove retired and abandoned versions.
+    
+    Args:
+        store_path: Directory holding the store versions (and the alias file)
+        collection_name: Alias that readers resolve
+        version: Name of the new version directory
+        collection_metadata: Embedding model/backend metadata to record
+        ids, documents, metadatas: Chunks to store
+        embeddings: (n, dim) embeddings of the documents
+        dtype: Stored embedding type (float16 or int8)
+        grace_seconds: How long to keep replaced versions
+    
+    Returns:
+        The new NumpyVectorStore
+    """
+    import shutil
+    
+    version_path = os.path.join(store_path, version)
+    built = False
+    try:
+        store = build_numpy_store(
+            version_path, embeddings, documents, metadatas, ids,
+            dtype=dtype, metadata={"alias": collection_name, **collection_metadata}
+        )
+        validate_index(store, ids, lambda rows: embeddings[rows])
+        metrics.increment("chunks_indexed_total", len(ids), store="numpy")
+        built = True
+    finally:
+        if not built:
+            shutil.rmtree(version_path, ignore_errors=True)
+            print(f"❌ Build failed, {collection_name} still points at the previous version")
+    
+    flip_alias(store_path, collection_name, version)
+    status(f"\n✅ Successfully stored {store.count()} chunks in {version_path}")
+    status(f"✅ {collection_name} -> {version}")
+    status(f"{'='*60}")
+    
+    remove_version = lambda name: shutil.rmtree(os.path.join(store_path, name))
+    collect_expired(store_path, collection_name, remove_version, grace_seconds)
+    collect_abandoned(store_path, collection_name,
+                      [e for e in os.listdir(store_path) if os.path.isdir(os.path.join(store_path, e))],
+                      remove_version, grace_seconds)
+    return store
+
+
+def load_data_to_chromadb(data_path="app/data", collection_name="book_worm", backend=None,
+                          db_path=CHROMA_PATH, grace_seconds=GRACE_SECONDS, dedup_threshold=DEDUP_THRESHOLD):
+    """
+    Load all JSON chunks from the data directory into ChromaDB
+    
+    The data is loaded into a new versioned collection (e.g.
+    book_worm_v20251123T122554_123). Once it passes validation, the
+    collection_name alias is flipped to it. Readers keep serving from the
+    previous version until then. Replaced versions are deleted once they
+    have been retired for longer than grace_seconds.
+    
+    Args:
+        data_path: Path to the data directory containing series folders
+        collection_name: Alias that readers resolve
+        backend: Embedding backend (torch, onnx, onnx-int8); recorded in the
+            collection metadata so queries use the same one
+        db_path: ChromaDB directory
+        grace_seconds: How long to keep replaced versions
+        dedup_threshold: Near-duplicate similarity threshold (0 disables)
+    
+    Returns:
+        The new collection, or None if there was nothing to load
+    """
+    import chromadb
+    from chromadb import Documents, EmbeddingFunction, Embeddings
+    
+    backend = backend or DEFAULT_BACKEND
+    
+    # Initialize ChromaDB client
+    # This creates a persistent database in the db_path folder
+    client = chromadb.PersistentClient(path=db_path)
+    
+    # Load high-quality embedding model
+    status(f"Loading embedding model ({backend} backend)...")
+    with span("load_embedding_model", backend=backend):
+        model = load_embedding_model(backend)
+    status(f"✅ Model loaded: {EMBEDDING_MODEL} (768 dimensions, {backend})")
+    
+    # Create collection with custom embedding function
+    class CustomEmbeddingFunction(EmbeddingFunction):
+        def __call__(self, input: Documents) -> Embeddings:
+            with span("embed", texts=len(input)):
+                return model.encode(input).tolist()
+    
+    version = new_version_name(collection_name)
+    status(f"Loading data into ChromaDB collection: {version}")
+    status(f"{'='*60}\n")
+    
+    with span("load_documents"):
+        documents, metadatas, ids = load_documents(data_path, dedup_threshold)
+    if not documents:
         print("⚠️  No documents found to load")
+        return None
+    
+    # Smaller batches for the custom embedding function
+    collection = publish_chromadb_version(
+        client, db_path, collection_name, version, embedding_metadata(backend),
+        ids, documents, metadatas,
+        embed_rows=lambda rows: model.encode([documents[i] for i in rows]),
+        embedding_function=CustomEmbeddingFunction(),
+        batch_size=100,
+        grace_seconds=grace_seconds
+    )
+    metrics.write_metrics()
     
     return collection
 
 
+def load_data_to_numpy_store(data_path="app/data", store_path=NUMPY_STORE_PATH, backend=None, dtype="float16",
+                             collection_name="book_worm", grace_seconds=GRACE_SECONDS, dedup_threshold=DEDUP_THRESHOLD):
+    """
+    Load all JSON chunks into a memory-mapped NumpyVectorStore
+    
+    Like load_data_to_chromadb, the store is built into a new version
+    directory and the alias is flipped once it validates.
+    
+    Args:
+        data_path: Path to the data directory containing series folders
+        store_path: Directory holding the store versions
+        backend: Embedding backend (torch, onnx, onnx-int8)
+        dtype: Stored embedding type (float16 or int8)
+        collection_name: Alias that readers resolve
+        grace_seconds: How long to keep replaced versions
+        dedup_threshold: Near-duplicate similarity threshold (0 disables)
+    """
+    backend = backend or DEFAULT_BACKEND
+    
+    status(f"Loading embedding model ({backend} backend)...")
+    with span("load_embedding_model", backend=backend):
+        model = load_embedding_model(backend)
+    status(f"✅ Model loaded: {EMBEDDING_MODEL} (768 dimensions, {backend})")
+    
+    version = new_version_name(collection_name)
+    status(f"Loading data into vector store: {os.path.join(store_path, version)} ({dtype})")
+    status(f"{'='*60}\n")
+    
+    with span("load_documents"):
+        documents, metadatas, ids = load_documents(data_path, dedup_threshold)
+    if not documents:
+        print("⚠️  No documents found to load")
+        return None
+    
+    status(f"\n{'='*60}")
+    status(f"Embedding {len(documents)} chunks...")
+    with span("embed", texts=len(documents)):
+        embeddings = model.encode(documents, batch_size=64, show_progress_bar=metrics.VERBOSITY >= 1)
+    
+    store = publish_numpy_version(
+        store_path, collection_name, version, embedding_metadata(backend),
+        ids, documents, metadatas, embeddings,
+        dtype=dtype,
+        grace_seconds=grace_seconds
+    )
+    metrics.write_metrics()
+    
+    return store
+
+
 if __name__ == "__main__":
-    # Load all data into ChromaDB
-    collection = load_data_to_chromadb()
+    parser = argparse.ArgumentParser(description="Load every JSON chunk under app/data into the vector store")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=DEFAULT_BACKEND,
+                        help="Embedding backend (default: %(default)s)")
+    parser.add_argument("--store", choices=VECTOR_STORES, default=DEFAULT_VECTOR_STORE,
+                        help="Vector store to build (default: %(default)s)")
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default="float16",
+                        help="Embedding type for the numpy store (default: %(default)s)")
+    parser.add_argument("--grace-seconds", type=int, default=GRACE_SECONDS,
+                        help="Keep replaced index versions this long before deleting them (default: %(default)s)")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="Merge chunks at least this similar (MinHash Jaccard estimate); 0 keeps all (default: %(default)s)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print warnings and errors")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print per-file and per-batch progress")
+    args = parser.parse_args()
+    
+    if args.quiet:
+        metrics.set_verbosity(0)
+    elif args.verbose:
+        metrics.set_verbosity(2)
+    
+    if args.store == "numpy":
+        store = load_data_to_numpy_store(backend=args.backend, dtype=args.dtype, grace_seconds=args.grace_seconds,
+                                         dedup_threshold=args.dedup_threshold)
+    else:
+        # Load all data into ChromaDB
+        collection = load_data_to_chromadb(backend=args.backend, grace_seconds=args.grace_seconds,
+                                           dedup_threshold=args.dedup_threshold)
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# ============================================
+# CONFIGURATION (environment variables)
+#   BOOKWORM_VERBOSITY     0 = errors and answers only, 1 = progress (default), 2 = debug
+#   BOOKWORM_LOG_JSON      write structured JSON events to this file ("-" for stderr)
+#   BOOKWORM_METRICS_FILE  write Prometheus text metrics to this file
+#   BOOKWORM_METRICS_PORT  serve Prometheus text metrics on http://localhost:<port>/metrics
+# ============================================
+
+VERBOSITY = int(os.environ.get("BOOKWORM_VERBOSITY", "1"))
+JSON_LOG = os.environ.get("BOOKWORM_LOG_JSON")
+METRICS_FILE = os.environ.get("BOOKWORM_METRICS_FILE")
+METRICS_PORT = os.environ.get("BOOKWORM_METRICS_PORT")
+
+PREFIX = "bookworm_"
+
+# Histogram buckets for durations (seconds) and sizes (tokens)
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+TOKEN_BUCKETS = [64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384]
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_help = {}
+_server = None
+
+
+def set_verbosity(level):
+    """Change how much progress output status() prints"""
+    global VERBOSITY
+    VERBOSITY = level
+
+
+def status(message, level=1):
+    """Print a progress message if the verbosity allows it"""
+    if VERBOSITY >= level:
+        print(message)
+
+
+def count_tokens(text):
+    """
+    Approximate token count (~4 characters per token for llama-style
+    tokenizers); good enough for comparing prompt sizes
+    """
+    return max(1, len(text) // 4) if text else 0
+
+
+def _key(name, labels):
+    return (PREFIX + name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def log_event(event, **fields):
+    """Write one structured JSON event if BOOKWORM_LOG_JSON is set"""
+    if not JSON_LOG:
+        return
+    line = json.dumps({"ts": time.time(), "event": event, **fields}, ensure_ascii=False, default=str)
+    with _lock:
+        if JSON_LOG == "-":
+            print(line, file=sys.stderr)
+        else:
+            with open(JSON_LOG, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+def increment(name, value=1, **labels):
+    """Add to a counter, e.g. increment("chunks_indexed_total", 100)"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=SECONDS_BUCKETS, **labels):
+    """Record a value in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            _histograms[key] = histogram
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def describe(name, text):
+    """Set the # HELP text for a metric"""
+    _help[PREFIX + name] = text
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Time a block of code
+
+    Records bookworm_span_seconds{span=name} and logs a JSON "span" event.
+    Extra fields can be attached to the event through the yielded dict:
+
+        with span("search", series=series_filter) as fields:
+            results = collection.query(...)
+            fields["results"] = len(results)
+    """
+    fields = {}
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        duration = time.perf_counter() - start
+        observe("span_seconds", duration, span=name)
+        log_event("span", name=name, duration_ms=round(duration * 1000, 3), **labels, **fields)
+
+
+def get_counter(name, **labels):
+    """Current value of a counter (0 if never incremented)"""
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def prometheus_text():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), histogram in histograms:
+        if name not in seen:
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=None):
+    """Write Prometheus text metrics to a file (atomically), if configured"""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def serve_metrics(port=None):
+    """
+    Serve /metrics on localhost in a background thread (once per process)
+
+    Returns:
+        The server, or None if no port is configured
+    """
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    port = port or METRICS_PORT
+    if not port or _server is not None:
+        return _server
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _server = ThreadingHTTPServer(("127.0.0.1", int(port)), MetricsHandler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    status(f"Metrics available at http://127.0.0.1:{port}/metrics")
+    return _server
+
+
+describe("span_seconds", "Duration of named pipeline stages")
+describe("prompt_tokens", "Approximate prompt size sent to Ollama")
+describe("ollama_prompt_eval_seconds", "Ollama prompt evaluation (prefill) time")
+describe("ollama_eval_seconds", "Ollama generation time")
+describe("cache_hits_total", "Cache hits by cache")
+describe("cache_misses_total", "Cache misses by cache")
@@ -1,54 +1,98 @@
-import requests
 import sys
-sys.path.append('.')
+import json
 
-from query import query_books
-import chromadb
-from sentence_transformers import SentenceTransformer
+import metrics
+from metrics import status, span
+
+# requests, chromadb and sentence_transformers (which pulls in torch) are
+# imported where they are first needed so that --help, argument errors and
+# quitting the chat return immediately.
 
 class BookWormOllamaRAG:
     """RAG system using Ollama for local LLM inference"""
     
-    def __init__(self, model_name="llama3.2:latest", ollama_url="http://localhost:11434"):
+    def __init__(self, model_name="llama3.2:latest", ollama_url="http://localhost:11434", embedding_backend=None, vector_store=None, index_path=None, rerank=None):
         """
         Initialize BookWorm RAG with Ollama
         
         Args:
             model_name: Ollama model to use (llama3.2:latest)
             ollama_url: URL where Ollama is running
+            embedding_backend: Embedding backend (torch, onnx, onnx-int8).
+                Defaults to the one recorded in the index; must match it.
+            vector_store: chroma or numpy (defaults to BOOKWORM_VECTOR_STORE)
+            index_path: Vector store directory (defaults to ./chroma_db or ./vector_store)
+            rerank: Rerank retrieved chunks with a cross-encoder (defaults to BOOKWORM_RERANK)
         """
         self.model_name = model_name
         self.ollama_url = ollama_url
+        self.embedding_backend = embedding_backend
+        self.vector_store = vector_store
+        self.index_path = index_path
         
-        # Initialize ChromaDB connection
-        self.client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.client.get_collection(name="book_worm")
+        # ChromaDB and the embedding model are loaded on first retrieval
+        self._collection = None
+        self._model = None
+        self._model_backend = None
         
-        # Load the same embedding model used in the database
-        self.model = SentenceTransformer('all-mpnet-base-v2')
+        # Optional cross-encoder reranking of the dense results
+        from reranker import RERANK_ENABLED, Reranker
+        self.reranker = Reranker() if (RERANK_ENABLED if rerank is None else rerank) else None
         
-        # Test Ollama connection
-        self.ollama_ready = self.testConnection()
-        if not self.ollama_ready:
-            print("\n  Ollama is not ready. You can still search your books, but AI responses won't work.")
-            print(" To fix: Make sure Ollama is running with: ollama serve")
-            print(" Or try restarting the Ollama app\n")
+        # Ollama is tested before the first answer is generated
+        self._ollama_ready = None
+    
+    @property
+    def ollama_ready(self):
+        """Whether Ollama is running with the model, tested on first use"""
+        if self._ollama_ready is None:
+            self._ollama_ready = self.testConnection()
+            if not self._ollama_ready:
+                print("\n  Ollama is not ready. You can still search your books, but AI responses won't work.")
+                print(" To fix: Make sure Ollama is running with: ollama serve")
+                print(" Or try restarting the Ollama app\n")
+        return self._ollama_ready
+    
+    @property
+    def collection(self):
+        """Vector store collection (ChromaDB or numpy), opened on first use"""
+        if self._collection is None:
+            from vector_store import open_vector_store
+            self._collection = open_vector_store(self.vector_store, collection_name="book_worm", path=self.index_path)
+        return self._collection
+    
+    @property
+    def model(self):
+        """Embedding model, loaded on first use"""
+        from embeddings import load_embedding_model, resolve_backend
+        # Load the same embedding model and backend used in the database.
+        # Checked on every use since a rebuilt index may use another backend.
+        backend = resolve_backend(self.collection.metadata, self.embedding_backend)
+        if self._model is None or backend != self._model_backend:
+            metrics.increment("cache_misses_total", cache="embedding_model")
+            with span("load_embedding_model", backend=backend):
+                self._model = load_embedding_model(backend)
+            self._model_backend = backend
+        else:
+            metrics.increment("cache_hits_total", cache="embedding_model")
+        return self._model
     
     def testConnection(self):
         """Test if Ollama is running and model is available"""
+        import requests
         try:
             # Check if Ollama is running
             response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
             if response.status_code == 200:
                 models = [model['name'] for model in response.json().get('models', [])]
                 if self.model_name in models:
-                    print(f" Ollama connected with model: {self.model_name}")
+                    status(f" Ollama connected with model: {self.model_name}")
                     
                     # Test with a simple prompt
-                    print(" Testing model response...")
+                    status(" Testing model response...")
                     test_response = self.callOllama("Say 'Hello' in one word.", max_tokens=10)
                     if "Error:" not in test_response:
-                        print(" Model test successful!")
+                        status(" Model test successful!")
                         return True
                     else:
                         print(f" Model test failed: {test_response}")
@@ -69,7 +113,7 @@ class BookWormOllamaRAG:
             return False
     
     def getRelevantContext(self, query, series_filter=None, n_results=7):
-        """Retrieve relevant context from ChromaDB"""
+        """Retrieve relevant context from the vector store"""
         where_clause = None
         filters = []
         if series_filter:
@@ -78,27 +122,55 @@ class BookWormOllamaRAG:
             where_clause = filters[0]
         elif len(filters) > 1:
             where_clause = {"$and": filters}
-        query_embedding = self.model.encode([query])
-        results = self.collection.query(
-            query_embeddings=query_embedding.tolist(),
-            n_results=n_results,
-            where=where_clause
-        )
+        model = self.model
+        with span("embed"):
+            query_embedding = model.encode([query])
+        # Over-fetch when reranking; the reranker keeps the best few
+        fetch = max(n_results, self.reranker.candidates) if self.reranker else n_results
+        with span("search", n_results=fetch, series=series_filter) as fields:
+            results = self.collection.query(
+                query_embeddings=query_embedding.tolist(),
+                n_results=fetch,
+                where=where_clause
+            )
+            fields["results"] = len(results['documents'][0])
+        metrics.increment("retrieved_chunks_total", len(results['documents'][0]))
         context_chunks = []
-        for doc, metadata, distance in zip(
+        for chunk_id, doc, metadata, distance in zip(
+            results['ids'][0],
             results['documents'][0], 
             results['metadatas'][0], 
             results['distances'][0]
         ):
             similarity = (1 - distance) * 100
+            # A merged near-duplicate lists every [name, section] it came from
+            sources = metadata.get('sources')
+            sources = [tuple(s) for s in json.loads(sources)] if sources else [(metadata.get('name', ''), metadata.get('section', ''))]
             context_chunks.append({
+                'id': chunk_id,
                 'text': doc,
                 'series': metadata.get('series', ''),
                 'type': metadata.get('type', ''),
                 'name': metadata.get('name', ''),
                 'section': metadata.get('section', ''),
+                'sources': sources,
                 'similarity': similarity
             })
+        
+        if self.reranker:
+            with span("rerank") as fields:
+                context_chunks, info = self.reranker.rerank(
+                    query, context_chunks,
+                    top_k=min(n_results, self.reranker.top_k),
+                    dense_k=n_results,
+                    version=getattr(self.collection, "version", None)
+                )
+                fields.update(info)
+            if info["fallback"]:
+                status(f" Reranking over budget ({info['latency_ms']:.0f} ms), using dense order")
+            else:
+                status(f" Reranked {info['candidates']} passages in {info['latency_ms']:.0f} ms "
+                       f"({info['cache_hits']} cached), ~{info['tokens_saved']} context tokens saved")
         return context_chunks
     
     def formatContext(self, context_chunks):
@@ -117,13 +189,39 @@ class BookWormOllamaRAG:
                 source += f" - {chunk['type']}"
             if chunk['section']:
                 source += f" - {chunk['section']}"
+            also = [name for name, _ in chunk.get('sources', []) if name != chunk['name']]
+            if also:
+                source += f" (also on: {', '.join(dict.fromkeys(also))})"
             context += f"[Source {i}] {source} (Relevance: {chunk['similarity']:.1f}%)\n"
             context += f"{chunk['text']}\n\n"
         
         return context
     
+    def buildPrompt(self, question, context_chunks):
+        """Build the spoiler-safe prompt sent to the LLM"""
+        # Format context for LLM
+        context = self.formatContext(context_chunks)
+        
+        # Create prompt with stronger spoiler protection
+        prompt = f"""You are a helpful book assistant. Answer questions about characters and settings WITHOUT spoilers.
+
+                    {context}
+
+                    Question: {question}
+
+                    ABSOLUTE RULES - DO NOT BREAK THESE:
+                    1. NEVER mention character deaths, even in past tense (e.g., "who died", "tragically died", "was killed")
+                    2. NEVER mention major plot events like betrayals, battles, or romantic outcomes
+                    3. If the context contains death/fate information - IGNORE IT completely
+                    4. Only discuss: character appearance, personality traits, family background, early introductions
+                    5. If you can't answer without spoilers, say: "I can't discuss that without spoiling the story."
+
+                    Answer (NO deaths, NO fates, NO plot outcomes):"""
+        return prompt
+    
     def callOllama(self, prompt, temperature=0.2, max_tokens=1000):
         """Make a request to Ollama API"""
+        import requests
         
         data = {
             "model": self.model_name,
@@ -136,7 +234,7 @@ class BookWormOllamaRAG:
         }
         
         try:
-            print(" Thinking... (this may take 10-30 seconds)")
+            status(" Thinking... (this may take 10-30 seconds)")
             response = requests.post(
                 f"{self.ollama_url}/api/generate",
                 json=data,
@@ -145,6 +243,7 @@ class BookWormOllamaRAG:
             
             if response.status_code == 200:
                 result = response.json()
+                self.recordOllamaStats(result)
                 return result.get("response", "No response generated")
             else:
                 return f"Error: Ollama returned status {response.status_code}\nResponse: {response.text}"
@@ -156,6 +255,28 @@ class BookWormOllamaRAG:
         except Exception as e:
             return f"Error calling Ollama: {e}"
     
+    def recordOllamaStats(self, result):
+        """Record Ollama's own token counts and durations from a response"""
+        prompt_tokens = result.get("prompt_eval_count", 0)
+        eval_tokens = result.get("eval_count", 0)
+        metrics.increment("ollama_prompt_tokens_total", prompt_tokens, model=self.model_name)
+        metrics.increment("ollama_generated_tokens_total", eval_tokens, model=self.model_name)
+        # Ollama reports durations in nanoseconds
+        if "prompt_eval_duration" in result:
+            metrics.observe("ollama_prompt_eval_seconds", result["prompt_eval_duration"] / 1e9, model=self.model_name)
+        if "eval_duration" in result:
+            metrics.observe("ollama_eval_seconds", result["eval_duration"] / 1e9, model=self.model_name)
+        metrics.log_event(
+            "ollama_generate",
+            model=self.model_name,
+            prompt_eval_count=prompt_tokens,
+            eval_count=eval_tokens,
+            prompt_eval_ms=result.get("prompt_eval_duration", 0) / 1e6,
+            eval_ms=result.get("eval_duration", 0) / 1e6,
+            load_ms=result.get("load_duration", 0) / 1e6,
+            total_ms=result.get("total_duration", 0) / 1e6
+        )
+    
     def ask(self, question, series_filter=None, show_context=False, n_results=12):
         """
         Ask a question about your books and get an AI-generated response
@@ -169,16 +290,22 @@ class BookWormOllamaRAG:
         Returns:
             AI-generated answer based on book content
         """
-        
-        print(f"\n{'='*80}")
-        print(f"BOOK-WORM AI CHAT")
-        print(f"{'='*80}")
-        print(f"Question: {question}")
+        with span("ask", series=series_filter):
+            response = self._ask(question, series_filter, show_context, n_results)
+        metrics.increment("questions_total")
+        metrics.write_metrics()
+        return response
+    
+    def _ask(self, question, series_filter, show_context, n_results):
+        status(f"\n{'='*80}")
+        status(f"BOOK-WORM AI CHAT")
+        status(f"{'='*80}")
+        status(f"Question: {question}")
         
         if series_filter:
-            print(f" Series filter: {series_filter}")
+            status(f" Series filter: {series_filter}")
         
-        print(f"\n Searching for relevant information...")
+        status(f"\n Searching for relevant information...")
         
         # Get relevant context
         context_chunks = self.getRelevantContext(
@@ -186,10 +313,10 @@ class BookWormOllamaRAG:
         )
         
         if not context_chunks:
-            print(" No relevant information found in the books.")
+            status(" No relevant information found in the books.", level=0)
             return "I couldn't find any relevant information about that in the books."
         
-        print(f" Found {len(context_chunks)} relevant passages")
+        status(f" Found {len(context_chunks)} relevant passages")
         
         # Show context if requested
         if show_context:
@@ -207,34 +334,23 @@ class BookWormOllamaRAG:
                 print(f"  {chunk['text'][:100]}...")
                 print()
         
-        # Format context for LLM
-        context = self.formatContext(context_chunks)
+        with span("prompt_build") as fields:
+            prompt = self.buildPrompt(question, context_chunks)
+            prompt_tokens = metrics.count_tokens(prompt)
+            fields["prompt_tokens"] = prompt_tokens
+        metrics.observe("prompt_tokens", prompt_tokens, buckets=metrics.TOKEN_BUCKETS)
+        metrics.increment("context_chunks_total", len(context_chunks))
         
-        # Create prompt with stronger spoiler protection
-        prompt = f"""You are a helpful book assistant. Answer questions about characters and settings WITHOUT spoilers.
-
-                    {context}
-
-                    Question: {question}
-
-                    ABSOLUTE RULES - DO NOT BREAK THESE:
-                    1. NEVER mention character deaths, even in past tense (e.g., "who died", "tragically died", "was killed")
-                    2. NEVER mention major plot events like betrayals, battles, or romantic outcomes
-                    3. If the context contains death/fate information - IGNORE IT completely
-                    4. Only discuss: character appearance, personality traits, family background, early introductions
-                    5. If you can't answer without spoilers, say: "I can't discuss that without spoiling the story."
-
-                    Answer (NO deaths, NO fates, NO plot outcomes):"""
-
-        print(f" Generating response with {self.model_name}...")
+        status(f" Generating response with {self.model_name}...")
         
         # Check if Ollama is ready
         if not self.ollama_ready:
-            print("\n  Ollama is not ready. Showing search results only.")
+            status("\n  Ollama is not ready. Showing search results only.", level=0)
             return "Ollama is not available. Please check the search results above."
         
         # Get response from Ollama
-        response = self.callOllama(prompt)
+        with span("generate", model=self.model_name):
+            response = self.callOllama(prompt)
         
         print(f"\n AI RESPONSE:")
         print("-" * 60)
@@ -266,7 +382,7 @@ class BookWormOllamaRAG:
             try:
                 user_input = input(" Ask about your books: ").strip()
                 
-                if user_input.lower() in ['quit', 'exit', 'q']:
+                if user_input.lower() in ['quit', 'exit', 'q', '/quit']:
                     print("\n Happy reading!\n")
                     break
                 
@@ -316,52 +432,92 @@ class BookWormOllamaRAG:
                 print(f"\n Error: {e}\n")
 
 
+USAGE = """Usage: python3 app/ollama_chat.py [options] [question]
+
+Without a question, starts the interactive chat.
+
+Options:
+  --series <name>   Only use passages from this series
+  --book <name>     Book filter (accepted, not yet applied)
+  --books <n>       Spoiler protection up to book n (accepted, not yet applied)
+  --no-context      Don't print the retrieved passages
+  --rerank          Rerank passages with a cross-encoder (also BOOKWORM_RERANK=1)
+  -q, --quiet       Only print answers and errors
+  -v, --verbose     Print debug progress too
+  -h, --help        Show this message
+
+Examples:
+  python3 app/ollama_chat.py "Who is Harry Potter?"
+  python3 app/ollama_chat.py --series "Red Rising" "Tell me about Darrow"
+"""
+
+
 def main():
     """Main function for the RAG system"""
     
-    # Initialize the RAG system
-    rag = BookWormOllamaRAG(model_name="llama3.2:latest")
+    # Parse arguments before initializing anything heavy
+    series_filter = None
+    book_filter = None
+    max_book_number = None
+    show_context = True
+    question_parts = []
+    rerank = None
+    # Flags that make sense without a question (interactive chat)
+    standalone_args = 0
     
-    # Check command line arguments
-    if len(sys.argv) > 1:
-        # Check for flags
-        series_filter = None
-        book_filter = None
-        max_book_number = None
-        show_context = True
-        question_parts = []
-        
-        i = 1
-        while i < len(sys.argv):
-            arg = sys.argv[i]
-            if arg == "--series" and i + 1 < len(sys.argv):
-                series_filter = sys.argv[i + 1]
-                i += 2
-            elif arg == "--book" and i + 1 < len(sys.argv):
-                book_filter = sys.argv[i + 1]
+    i = 1
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+        if arg in ("-h", "--help"):
+            print(USAGE)
+            return
+        elif arg == "--series" and i + 1 < len(sys.argv):
+            series_filter = sys.argv[i + 1]
+            i += 2
+        elif arg == "--book" and i + 1 < len(sys.argv):
+            book_filter = sys.argv[i + 1]
+            i += 2
+        elif arg == "--books" and i + 1 < len(sys.argv):
+            try:
+                max_book_number = int(sys.argv[i + 1])
                 i += 2
-            elif arg == "--books" and i + 1 < len(sys.argv):
-                try:
-                    max_book_number = int(sys.argv[i + 1])
-                    i += 2
-                except ValueError:
-                    print(f" Invalid book number: {sys.argv[i + 1]}")
-                    return
-            elif arg == "--no-context":
-                show_context = False
-                i += 1
-            else:
-                question_parts.append(arg)
-                i += 1
-        
-        if question_parts:
-            question = " ".join(question_parts)
-            rag.ask(question, series_filter=series_filter, book_filter=book_filter, max_book_number=max_book_number, show_context=show_context)
+            except ValueError:
+                print(f" Invalid book number: {sys.argv[i + 1]}")
+                return
+        elif arg == "--no-context":
+            show_context = False
+            i += 1
+        elif arg in ("-q", "--quiet"):
+            metrics.set_verbosity(0)
+            standalone_args += 1
+            i += 1
+        elif arg in ("-v", "--verbose"):
+            metrics.set_verbosity(2)
+            standalone_args += 1
+            i += 1
+        elif arg == "--rerank":
+            rerank = True
+            standalone_args += 1
+            i += 1
         else:
-            print(" No question provided")
-            print("\nUsage examples:")
-            print('  python3 app/ollama_chat.py "Who is Harry Potter?"')
-            print('  python3 app/ollama_chat.py --series RedRising "Tell me about Darrow"')
+            question_parts.append(arg)
+            i += 1
+    
+    if len(sys.argv) - 1 > standalone_args and not question_parts:
+        print(" No question provided")
+        print()
+        print(USAGE)
+        return
+    
+    # Expose metrics if BOOKWORM_METRICS_PORT is set
+    metrics.serve_metrics()
+    
+    # Initialize the RAG system
+    rag = BookWormOllamaRAG(model_name="llama3.2:latest", rerank=rerank)
+    
+    if question_parts:
+        question = " ".join(question_parts)
+        rag.ask(question, series_filter=series_filter, show_context=show_context)
     else:
         # Start interactive chat mode
         rag.chatMode()
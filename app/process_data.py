@@ -1,9 +1,15 @@
 import os
 import requests
 import json
+import time
+import argparse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import re
 
+import metrics
+from metrics import status, span
+
 # ============================================
 # LOAD SERIES CONFIGURATION FROM EXTERNAL FILE
 # Edit series_config.json to add new series!
@@ -23,8 +29,6 @@ def load_series_config():
         print(f"❌ Error parsing {config_path}: {e}")
         return {}
 
-SERIES_CONFIG = load_series_config()
-
 
 def get_page_content(page_title, api_url):
     """Fetch page content using Fandom's MediaWiki API"""
@@ -36,7 +40,7 @@ def get_page_content(page_title, api_url):
     }
     
     try:
-        response = requests.get(api_url, params=params)
+        response = requests.get(api_url, params=params, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         data = response.json()
 
@@ -164,59 +168,269 @@ def merge_chunks_by_section(chunks, name, doc_type, series_name, max_words=400):
 
 
 # ============================================
-# MAIN PROCESSING LOOP
+# PAGE DISCOVERY
+# Optional per-series settings in series_config.json:
+#   "categories": {"Characters": "characters", "Locations": "locations"}
+#   "all_pages": "articles"   (every main-namespace page, as this type)
 # ============================================
 
-if not SERIES_CONFIG:
-    print("❌ No series configuration loaded. Exiting.")
-    exit(1)
+# Concurrent requests per wiki (BOOKWORM_FETCH_WORKERS)
+FETCH_WORKERS = int(os.environ.get("BOOKWORM_FETCH_WORKERS", "4"))
+
+# Category listings are cached here and reused for DISCOVERY_TTL seconds
+DISCOVERY_CACHE_PATH = "app/cache/discovery"
+DISCOVERY_TTL = int(os.environ.get("BOOKWORM_DISCOVERY_TTL", "86400"))
+
+# Titles per listing request (the MediaWiki maximum for normal clients)
+LIST_LIMIT = 500
+
+# Seconds to wait on a wiki request before giving up on it
+REQUEST_TIMEOUT = int(os.environ.get("BOOKWORM_REQUEST_TIMEOUT", "30"))
+
+
+def normalize_title(title):
+    """Compare titles the way MediaWiki does: underscores as spaces, first letter uppercase"""
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+def safe_file_name(name):
+    """File name (without extension) a page's chunks are saved under"""
+    return name.replace("/", "-").replace("'", "")
+
 
-# Process each series in the configuration
-for series_name, series_config in SERIES_CONFIG.items():
-    print(f"\n{'='*60}")
-    print(f"Processing series: {series_name}")
-    print(f"{'='*60}")
+def list_pages(api_url, category=None):
+    """
+    Yield page titles from a category (list=categorymembers) or, without a
+    category, from the whole main namespace (list=allpages), following the
+    API's continuation tokens one batch at a time
+    """
+    if category:
+        params = {
+            'action': 'query',
+            'list': 'categorymembers',
+            'cmtitle': category if category.startswith("Category:") else f"Category:{category}",
+            'cmtype': 'page',
+            'cmnamespace': 0,
+            'cmlimit': LIST_LIMIT,
+            'format': 'json',
+        }
+        key = 'categorymembers'
+    else:
+        params = {
+            'action': 'query',
+            'list': 'allpages',
+            'apnamespace': 0,
+            'apfilterredir': 'nonredirects',
+            'aplimit': LIST_LIMIT,
+            'format': 'json',
+        }
+        key = 'allpages'
     
-    # Setup paths and API for this series
-    data_path = f"app/data/{series_name}"
-    os.makedirs(data_path, exist_ok=True)
+    cont = {'continue': ''}
+    while cont is not None:
+        response = requests.get(api_url, params={**params, **cont}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        if 'error' in data:
+            raise RuntimeError(data['error'].get('info', data['error']))
+        for member in data.get('query', {}).get(key, []):
+            yield member['title']
+        cont = data.get('continue')
+
+
+def _cache_file(api_url, category):
+    safe = re.sub(r'[^\w.-]+', '_', f"{api_url.split('//')[-1].split('/')[0]}_{category or 'allpages'}")
+    return os.path.join(DISCOVERY_CACHE_PATH, f"{safe}.json")
+
+
+def cached_list_pages(api_url, category=None, refresh=False):
+    """
+    list_pages() with a discovery cache
+    
+    A fresh cached listing is replayed without touching the wiki. Otherwise
+    titles are yielded as each batch arrives, and the full listing is cached
+    once it completes.
+    """
+    cache_file = _cache_file(api_url, category)
+    if not refresh and os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if time.time() - cached["fetched_at"] < DISCOVERY_TTL:
+            metrics.increment("cache_hits_total", cache="discovery")
+            yield from cached["titles"]
+            return
+    metrics.increment("cache_misses_total", cache="discovery")
     
-    wiki_base = series_config["wiki"]
-    api_url = f"https://{wiki_base}/api.php"
-    pages = series_config["pages"]
+    titles = []
+    for title in list_pages(api_url, category):
+        titles.append(title)
+        yield title
     
-    # Process each page in the series
-    for entry in pages:
-        page_title = entry["title"]
-        doc_type = entry["type"]  # e.g., characters, events
-        doc_name = entry["name"]  # e.g., "Darrow O'Lykos", "The Institute"
+    os.makedirs(DISCOVERY_CACHE_PATH, exist_ok=True)
+    tmp_path = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"api_url": api_url, "category": category, "fetched_at": time.time(), "titles": titles}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_file)
 
-        # Create subfolder for the type if it doesn't exist
-        type_path = os.path.join(data_path, doc_type)
-        os.makedirs(type_path, exist_ok=True)
 
+def discover_pages(series_name, series_config, api_url, known_titles, known_files, refresh=False, max_pages=None):
+    """
+    Yield page entries ({"title", "type", "name"}) for the configured
+    categories, skipping titles already listed by hand or in an earlier
+    category, and titles that would be saved to a file already taken
+    (e.g., "A/B" and "A-B")
+    
+    Args:
+        series_name: Series being processed (for metrics)
+        series_config: The series' entry in series_config.json
+        api_url: The wiki's api.php URL
+        known_titles: Normalized titles already queued; updated in place
+        known_files: (type, safe_file_name) pairs already queued; updated in place
+        refresh: Ignore the discovery cache
+        max_pages: Stop after this many discovered pages
+    """
+    sources = list(series_config.get("categories", {}).items())
+    if series_config.get("all_pages"):
+        sources.append((None, series_config["all_pages"]))
+    
+    found = 0
+    for category, doc_type in sources:
+        label = category or "all pages"
+        status(f"🔎 Discovering {label} -> {doc_type}")
         try:
-            # Fetch page content using Fandom API
+            with span("discover_pages", series=series_name, category=label) as fields:
+                new = 0
+                for title in cached_list_pages(api_url, category, refresh):
+                    normalized = normalize_title(title)
+                    if normalized in known_titles:
+                        continue
+                    known_titles.add(normalized)
+                    file_key = (doc_type, safe_file_name(title))
+                    if file_key in known_files:
+                        status(f"⚠️  Skipping {title} - {doc_type}/{file_key[1]}.json is already taken")
+                        continue
+                    known_files.add(file_key)
+                    new += 1
+                    found += 1
+                    metrics.increment("pages_discovered_total", series=series_name)
+                    yield {"title": title.replace(" ", "_"), "type": doc_type, "name": title}
+                    if max_pages and found >= max_pages:
+                        return
+                fields["pages"] = new
+        except Exception as e:
+            print(f"❌ Failed to discover {label}: {e}")
+
+
+# ============================================
+# MAIN PROCESSING LOOP
+# ============================================
+
+def process_page(entry, series_name, api_url, data_path):
+    """
+    Fetch, parse and save one page
+    
+    Returns:
+        Number of chunks written, or None if the page was skipped or failed
+    """
+    page_title = entry["title"]
+    doc_type = entry["type"]  # e.g., characters, events
+    doc_name = entry["name"]  # e.g., "Darrow O'Lykos", "The Institute"
+    
+    # Create subfolder for the type if it doesn't exist
+    type_path = os.path.join(data_path, doc_type)
+    os.makedirs(type_path, exist_ok=True)
+    
+    try:
+        # Fetch page content using Fandom API
+        with span("fetch_page", series=series_name, page=page_title):
             wikitext = get_page_content(page_title, api_url)
-            
-            if not wikitext:
-                print(f"⚠️  Skipping {page_title} - no content available")
-                continue
-            
-            # Parse wikitext into sections
+        
+        if not wikitext:
+            metrics.increment("pages_failed_total", series=series_name)
+            print(f"⚠️  Skipping {page_title} - no content available")
+            return None
+        metrics.increment("pages_fetched_total", series=series_name)
+        
+        # Parse wikitext into sections
+        with span("parse_page", series=series_name, page=page_title):
             chunks = parse_wikitext_sections(wikitext)
             merged_chunks = merge_chunks_by_section(chunks, doc_name, doc_type, series_name)
+        
+        # Save merged_chunks to a JSON file (one per document)
+        file_path = os.path.join(type_path, f"{safe_file_name(doc_name)}.json")
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(merged_chunks, file, indent=2, ensure_ascii=False)
+        
+        metrics.increment("chunks_written_total", len(merged_chunks), series=series_name)
+        status(f"✅ Saved: {file_path} ({len(merged_chunks)} chunks)")
+        return len(merged_chunks)
+    except Exception as e:
+        metrics.increment("pages_failed_total", series=series_name)
+        print(f"❌ Failed to process {page_title}: {e}")
+        return None
 
-            # Save merged_chunks to a JSON file (one per document)
-            safe_name = doc_name.replace("/", "-").replace("'", "")
-            file_path = os.path.join(type_path, f"{safe_name}.json")
-            with open(file_path, "w", encoding="utf-8") as file:
-                json.dump(merged_chunks, file, indent=2, ensure_ascii=False)
 
-            print(f"✅ Saved: {file_path} ({len(merged_chunks)} chunks)")
-        except Exception as e:
-            print(f"❌ Failed to process {page_title}: {e}")
+def main():
+    """Fetch, parse and save every page listed in (or discovered from) series_config.json"""
+    parser = argparse.ArgumentParser(description="Fetch wiki pages for every series in series_config.json")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS,
+                        help="Concurrent page requests per wiki (default: %(default)s)")
+    parser.add_argument("--no-discover", action="store_true",
+                        help="Only fetch the pages listed in series_config.json")
+    parser.add_argument("--refresh-discovery", action="store_true",
+                        help="Re-list categories instead of using the discovery cache")
+    parser.add_argument("--max-pages", type=int,
+                        help="Discover at most this many pages per series")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print warnings and errors")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print debug progress too")
+    args = parser.parse_args()
+    
+    if args.quiet:
+        metrics.set_verbosity(0)
+    elif args.verbose:
+        metrics.set_verbosity(2)
+    
+    SERIES_CONFIG = load_series_config()
+    if not SERIES_CONFIG:
+        print("❌ No series configuration loaded. Exiting.")
+        exit(1)
+    
+    # Process each series in the configuration
+    for series_name, series_config in SERIES_CONFIG.items():
+        status(f"\n{'='*60}")
+        status(f"Processing series: {series_name}")
+        status(f"{'='*60}")
+        
+        # Setup paths and API for this series
+        data_path = f"app/data/{series_name}"
+        os.makedirs(data_path, exist_ok=True)
+        
+        wiki_base = series_config["wiki"]
+        api_url = f"https://{wiki_base}/api.php"
+        pages = series_config.get("pages", [])
+        
+        # Hand-listed pages first, then discovered ones as the listings arrive;
+        # the pool bounds how many requests hit the wiki at once
+        known_titles = {normalize_title(entry["title"]) for entry in pages}
+        known_files = {(entry["type"], safe_file_name(entry["name"])) for entry in pages}
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = [executor.submit(process_page, entry, series_name, api_url, data_path) for entry in pages]
+            if not args.no_discover:
+                for entry in discover_pages(series_name, series_config, api_url, known_titles, known_files,
+                                            refresh=args.refresh_discovery, max_pages=args.max_pages):
+                    futures.append(executor.submit(process_page, entry, series_name, api_url, data_path))
+            results = [future.result() for future in futures]
+        
+        saved = sum(1 for r in results if r is not None)
+        status(f"{series_name}: saved {saved}/{len(results)} pages "
+               f"({len(results) - len(pages)} discovered, {len(results) - saved} skipped or failed)")
+    
+    status(f"\n{'='*60}")
+    status(f"All series processed successfully!")
+    status(f"{'='*60}\n")
+    metrics.write_metrics()
+
 
-print(f"\n{'='*60}")
-print(f"All series processed successfully!")
-print(f"{'='*60}\n")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
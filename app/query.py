@@ -1,6 +1,10 @@
-import chromadb
 import sys
-from sentence_transformers import SentenceTransformer
+
+import metrics
+from metrics import span
+
+# chromadb and the embedding model are imported inside query_books so the
+# interactive prompt, --help and 'quit' don't wait on torch to load.
 
 def query_books(query_text, series_filter=None, max_book_number=None, n_results=15):
     """
@@ -11,12 +15,14 @@ def query_books(query_text, series_filter=None, max_book_number=None, n_results=
         series_filter: Optional - filter by series name (e.g., "Red Rising", "Harry Potter")
         n_results: Number of results to return
     """
-    # Connect to the existing ChromaDB database
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_collection(name="book_worm")
+    from embeddings import load_embedding_model, resolve_backend
+    from vector_store import open_vector_store
     
-    # Load the same embedding model used in the database
-    model = SentenceTransformer('all-mpnet-base-v2')
+    # Connect to the existing vector store (ChromaDB unless BOOKWORM_VECTOR_STORE=numpy)
+    collection = open_vector_store(collection_name="book_worm")
+    
+    # Load the same embedding model and backend used in the database
+    model = load_embedding_model(resolve_backend(collection.metadata))
     
     # Build filter clause
     where_clause = None
@@ -38,13 +44,15 @@ def query_books(query_text, series_filter=None, max_book_number=None, n_results=
     print(f"{'='*80}\n")
     
     # Use the same embedding model as the database
-    query_embedding = model.encode([query_text])
+    with span("embed"):
+        query_embedding = model.encode([query_text])
     
-    results = collection.query(
-        query_embeddings=query_embedding.tolist(),
-        n_results=n_results,
-        where=where_clause
-    )
+    with span("search", series=series_filter or "", n_results=n_results):
+        results = collection.query(
+            query_embeddings=query_embedding.tolist(),
+            n_results=n_results,
+            where=where_clause
+        )
     
     # Display results
     if not results['documents'][0]:
@@ -70,11 +78,27 @@ def query_books(query_text, series_filter=None, max_book_number=None, n_results=
 
 
 if __name__ == "__main__":
+    # Verbosity flags may appear anywhere; everything else is the query
+    args = []
+    for arg in sys.argv[1:]:
+        if arg in ("-q", "--quiet"):
+            metrics.set_verbosity(0)
+        elif arg in ("-v", "--verbose"):
+            metrics.set_verbosity(2)
+        else:
+            args.append(arg)
+    
     # Example usage
-    if len(sys.argv) > 1:
+    if args and args[0] in ("-h", "--help"):
+        print("Usage: python3 app/query.py [-q | -v] [query]")
+        print("\nWithout a query, starts interactive mode.")
+        print("\n  -q, --quiet    Only print results and errors")
+        print("  -v, --verbose  Print debug progress too")
+    elif args:
         # Command-line query
-        query = " ".join(sys.argv[1:])
+        query = " ".join(args)
         query_books(query)
+        metrics.write_metrics()
     else:
         # Interactive mode
         print("="*80)
@@ -103,6 +127,7 @@ if __name__ == "__main__":
                 
                 # Run query
                 query_books(query, series_filter=series)
+                metrics.write_metrics()
                 
             except KeyboardInterrupt:
                 print("\n\nGoodbye!\n")
@@ -0,0 +1,168 @@
+import os
+import time
+from collections import OrderedDict
+
+import metrics
+from metrics import span
+
+# ============================================
+# CONFIGURATION (environment variables)
+#   BOOKWORM_RERANK             1 to rerank retrieved chunks (off by default)
+#   BOOKWORM_RERANK_MODEL       cross-encoder to score (query, chunk) pairs with
+#   BOOKWORM_RERANK_CANDIDATES  dense candidates fetched for the reranker
+#   BOOKWORM_RERANK_TOP_K       chunks kept after reranking
+#   BOOKWORM_RERANK_BUDGET_MS   scoring time after which the dense order is used
+# ============================================
+
+RERANK_ENABLED = os.environ.get("BOOKWORM_RERANK", "0") == "1"
+RERANK_MODEL = os.environ.get("BOOKWORM_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.environ.get("BOOKWORM_RERANK_CANDIDATES", "30"))
+RERANK_TOP_K = int(os.environ.get("BOOKWORM_RERANK_TOP_K", "5"))
+RERANK_BUDGET_MS = float(os.environ.get("BOOKWORM_RERANK_BUDGET_MS", "250"))
+
+# (query, chunk) pairs per forward pass; the budget is checked between batches
+RERANK_BATCH_SIZE = 8
+
+# Scores kept in memory, least recently used evicted first
+RERANK_CACHE_SIZE = 10000
+
+
+class Reranker:
+    """
+    Reorders dense retrieval results with a small cross-encoder on CPU
+    
+    Scores are cached per (index version, query, chunk ID), so repeated or
+    follow-up questions only score chunks they haven't seen. Batches are
+    sized from the measured cost per pair so scoring stops before the
+    budget runs out; if candidates are left unscored, the dense order is
+    kept for that request.
+    """
+    
+    def __init__(self, model_name=RERANK_MODEL, top_k=RERANK_TOP_K, candidates=RERANK_CANDIDATES,
+                 budget_ms=RERANK_BUDGET_MS, batch_size=RERANK_BATCH_SIZE, cache_size=RERANK_CACHE_SIZE):
+        """
+        Args:
+            model_name: Cross-encoder model (sentence-transformers CrossEncoder)
+            top_k: Chunks kept after reranking
+            candidates: Dense candidates to fetch and score
+            budget_ms: Scoring time budget per request
+            batch_size: Pairs scored per forward pass
+            cache_size: Maximum cached scores
+        """
+        self.model_name = model_name
+        self.top_k = top_k
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._model = None
+        # Measured scoring time per (query, chunk) pair, carried across requests
+        self._seconds_per_pair = None
+    
+    @property
+    def model(self):
+        """Cross-encoder, loaded on first use (not counted against the budget)"""
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            
+            with span("load_reranker", model=self.model_name):
+                self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+    
+    def clear_cache(self):
+        """Forget cached scores (e.g., so benchmarks time real scoring)"""
+        self._cache.clear()
+    
+    def _cached(self, key):
+        score = self._cache.get(key)
+        if score is not None:
+            self._cache.move_to_end(key)
+        return score
+    
+    def _store(self, key, score):
+        self._cache[key] = score
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def rerank(self, query, chunks, top_k=None, dense_k=None, version=None):
+        """
+        Rerank dense candidates
+        
+        Args:
+            query: The user's question
+            chunks: Candidates in dense order; each needs 'id' and 'text'
+            top_k: Chunks to keep (defaults to self.top_k)
+            dense_k: Chunks the dense order would have passed on; used for
+                the fallback and the tokens-saved figure
+            version: Index version, so scores from a rebuilt index aren't reused
+        
+        Returns:
+            (chunks, info) - the chunks to use and a dict with latency_ms,
+            scored, cache_hits, fallback and tokens_saved
+        """
+        top_k = top_k or self.top_k
+        dense_k = dense_k or top_k
+        dense = chunks[:dense_k]
+        info = {"candidates": len(chunks), "scored": 0, "cache_hits": 0, "latency_ms": 0.0,
+                "fallback": None, "tokens_saved": 0}
+        if not chunks:
+            return dense, info
+        
+        model = self.model
+        keys = [(version, query, chunk['id']) for chunk in chunks]
+        scores = [self._cached(key) for key in keys]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        info["cache_hits"] = len(chunks) - len(pending)
+        
+        start = time.perf_counter()
+        deadline = start + self.budget_ms / 1000
+        done = 0
+        while done < len(pending):
+            # Only score as many pairs as the remaining budget fits; without
+            # a measurement yet, a single pair serves as the probe
+            if self._seconds_per_pair is None:
+                size = 1
+            else:
+                size = min(self.batch_size, int((deadline - time.perf_counter()) / self._seconds_per_pair))
+            if size < 1:
+                info["fallback"] = "budget"
+                break
+            batch = pending[done:done + size]
+            batch_start = time.perf_counter()
+            batch_scores = model.predict([(query, chunks[i]['text']) for i in batch], batch_size=len(batch))
+            per_pair = (time.perf_counter() - batch_start) / len(batch)
+            self._seconds_per_pair = per_pair if self._seconds_per_pair is None else (self._seconds_per_pair + per_pair) / 2
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self._store(keys[i], scores[i])
+            info["scored"] += len(batch)
+            done += len(batch)
+        elapsed = time.perf_counter() - start
+        info["latency_ms"] = elapsed * 1000
+        
+        metrics.observe("rerank_seconds", elapsed)
+        metrics.increment("rerank_cache_hits_total", info["cache_hits"])
+        if info["fallback"]:
+            # Scores finished so far stay cached for the next request
+            metrics.increment("rerank_fallbacks_total", reason=info["fallback"])
+            metrics.log_event("rerank", query=query, **info)
+            return dense, info
+        
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        reranked = []
+        for i in order[:top_k]:
+            chunks[i]['rerank_score'] = scores[i]
+            reranked.append(chunks[i])
+        
+        info["tokens_saved"] = max(0, sum(metrics.count_tokens(c['text']) for c in dense)
+                                   - sum(metrics.count_tokens(c['text']) for c in reranked))
+        metrics.increment("rerank_tokens_saved_total", info["tokens_saved"])
+        metrics.log_event("rerank", query=query, **info)
+        return reranked, info
+
+
+metrics.describe("rerank_seconds", "Cross-encoder scoring time per request")
+metrics.describe("rerank_tokens_saved_total", "Approximate context tokens removed by reranking")
+metrics.describe("rerank_fallbacks_total", "Requests that kept the dense order")
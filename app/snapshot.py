@@ -0,0 +1,257 @@
+import os
+import io
+import sys
+import json
+import time
+import hashlib
+import tarfile
+import argparse
+
+from embeddings import EMBEDDING_BACKENDS, DEFAULT_BACKEND, EMBEDDING_MODEL, check_quantization
+from vector_store import VECTOR_STORES, DEFAULT_VECTOR_STORE, STORE_DTYPES, CHROMA_PATH, NUMPY_STORE_PATH, open_vector_store
+from index_alias import GRACE_SECONDS, new_version_name
+from load_to_vectordb import publish_chromadb_version, publish_numpy_version
+
+# Snapshot layout (a gzip-compressed tar):
+#   manifest.json   - format version, model/backend (and int8 quantization) identity, counts,
+#                     sha256 of each member
+#   embeddings.npy  - (n, dim) float32 unit vectors
+#   records.jsonl   - one {"id", "document", "metadata"} object per row
+SNAPSHOT_FORMAT = "book-worm-snapshot"
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_SUFFIX = ".bwsnap.tar.gz"
+
+# Rows fetched from / added to ChromaDB per call
+BATCH_SIZE = 1000
+
+
+def sha256_file(path):
+    """Hex sha256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _read_member(tar, name, snapshot_path):
+    try:
+        return tar.extractfile(name).read()
+    except KeyError:
+        raise ValueError(f"{snapshot_path} is missing {name}")
+
+
+def export_snapshot(output_dir=".", store=None, collection_name="book_worm", path=None):
+    """
+    Package the live index into a single snapshot file
+    
+    Args:
+        output_dir: Directory to write the snapshot (and its .sha256) to
+        store: Vector store to export from (chroma or numpy)
+        collection_name: Alias of the index to export
+        path: Store directory (defaults to the store's usual location)
+    
+    Returns:
+        Path of the written snapshot
+    """
+    import numpy as np
+    
+    collection = open_vector_store(store, collection_name=collection_name, path=path)
+    metadata = dict(collection.metadata or {})
+    total = collection.count()
+    print(f"Exporting {total} chunks from {collection.version}...")
+    
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for offset in range(0, total, BATCH_SIZE):
+        batch = collection.get(include=["documents", "metadatas", "embeddings"], limit=BATCH_SIZE, offset=offset)
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        embeddings.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    
+    vectors = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    
+    buffer = io.BytesIO()
+    np.save(buffer, vectors)
+    members = {
+        "embeddings.npy": buffer.getvalue(),
+        "records.jsonl": "".join(
+            json.dumps({"id": i, "document": d, "metadata": m}, ensure_ascii=False) + "\n"
+            for i, d, m in zip(ids, documents, metadatas)
+        ).encode('utf-8'),
+    }
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": time.time(),
+        "alias": collection_name,
+        "source_version": collection.version,
+        "embedding_model": metadata.get("embedding_model", EMBEDDING_MODEL),
+        "embedding_backend": metadata.get("embedding_backend", "torch"),
+        "embedding_quantization": metadata.get("embedding_quantization"),
+        "dimensions": int(vectors.shape[1]) if len(vectors) else 0,
+        "count": len(ids),
+        "files": {name: hashlib.sha256(data).hexdigest() for name, data in members.items()},
+    }
+    
+    os.makedirs(output_dir, exist_ok=True)
+    snapshot_path = os.path.join(output_dir, f"{collection.version}{SNAPSHOT_SUFFIX}")
+    with tarfile.open(snapshot_path, "w:gz") as tar:
+        _add_member(tar, "manifest.json", json.dumps(manifest, indent=2).encode('utf-8'))
+        for name, data in members.items():
+            _add_member(tar, name, data)
+    
+    checksum = sha256_file(snapshot_path)
+    with open(f"{snapshot_path}.sha256", 'w', encoding='utf-8') as f:
+        f.write(f"{checksum}  {os.path.basename(snapshot_path)}\n")
+    
+    size_mb = os.path.getsize(snapshot_path) / 1024 / 1024
+    print(f"✅ Saved snapshot: {snapshot_path} ({size_mb:.1f} MB, sha256 {checksum[:12]}...)")
+    return snapshot_path
+
+
+def read_snapshot(snapshot_path, backend=None):
+    """
+    Read and verify a snapshot
+    
+    Args:
+        snapshot_path: Path of the .bwsnap.tar.gz file
+        backend: Query-time embedding backend the snapshot must match
+    
+    Returns:
+        (manifest, embeddings, ids, documents, metadatas)
+    
+    Raises:
+        ValueError: If a checksum fails or the snapshot doesn't match the
+            query-time embedding model/backend/quantization
+    """
+    import numpy as np
+    
+    backend = backend or DEFAULT_BACKEND
+    
+    checksum_path = f"{snapshot_path}.sha256"
+    if os.path.exists(checksum_path):
+        with open(checksum_path, 'r', encoding='utf-8') as f:
+            expected = f.read().split()[0]
+        if sha256_file(snapshot_path) != expected:
+            raise ValueError(f"Checksum mismatch for {snapshot_path}")
+    else:
+        print(f"⚠️  No {os.path.basename(checksum_path)} found, checking member checksums only")
+    
+    with tarfile.open(snapshot_path, "r:gz") as tar:
+        manifest = json.loads(_read_member(tar, "manifest.json", snapshot_path))
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{snapshot_path} is not a Book-Worm snapshot")
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {manifest.get('format_version')}")
+        
+        # Reject before reading the payload if it was embedded differently
+        if manifest["embedding_model"] != EMBEDDING_MODEL:
+            raise ValueError(f"Snapshot was embedded with '{manifest['embedding_model']}' but queries use '{EMBEDDING_MODEL}'")
+        if manifest["embedding_backend"] != backend:
+            raise ValueError(
+                f"Snapshot was embedded with the '{manifest['embedding_backend']}' backend but queries use '{backend}'. "
+                f"Import with --backend {manifest['embedding_backend']} or export a matching snapshot."
+            )
+        if manifest["embedding_backend"] == "onnx-int8":
+            check_quantization(manifest.get("embedding_quantization"), source="Snapshot")
+        
+        members = {}
+        for name, expected in manifest["files"].items():
+            data = _read_member(tar, name, snapshot_path)
+            if hashlib.sha256(data).hexdigest() != expected:
+                raise ValueError(f"Checksum mismatch for {name} in {snapshot_path}")
+            members[name] = data
+    
+    embeddings = np.load(io.BytesIO(members["embeddings.npy"]))
+    records = [json.loads(line) for line in members["records.jsonl"].decode('utf-8').split('\n') if line]
+    if len(records) != manifest["count"] or len(embeddings) != manifest["count"]:
+        raise ValueError(f"Snapshot has {len(records)} records and {len(embeddings)} embeddings, manifest says {manifest['count']}")
+    
+    ids = [r["id"] for r in records]
+    documents = [r["document"] for r in records]
+    metadatas = [r["metadata"] for r in records]
+    return manifest, embeddings, ids, documents, metadatas
+
+
+def import_snapshot(snapshot_path, store=None, backend=None, collection_name="book_worm", path=None,
+                    dtype="float16", grace_seconds=GRACE_SECONDS):
+    """
+    Hydrate an index from a snapshot without running the embedding model
+    
+    The snapshot is loaded into a new index version and the alias is flipped
+    once it validates, exactly like a rebuild with load_to_vectordb.py.
+    
+    Args:
+        snapshot_path: Path of the .bwsnap.tar.gz file
+        store: Vector store to hydrate (chroma or numpy)
+        backend: Query-time embedding backend the snapshot must match
+        collection_name: Alias readers resolve
+        path: Store directory (defaults to the store's usual location)
+        dtype: Stored embedding type for the numpy store
+        grace_seconds: How long to keep replaced versions
+    
+    Returns:
+        Name of the new index version
+    """
+    store = store or DEFAULT_VECTOR_STORE
+    manifest, embeddings, ids, documents, metadatas = read_snapshot(snapshot_path, backend)
+    collection_metadata = {
+        "embedding_model": manifest["embedding_model"],
+        "embedding_backend": manifest["embedding_backend"],
+        "snapshot": manifest["source_version"],
+    }
+    if manifest.get("embedding_quantization"):
+        collection_metadata["embedding_quantization"] = manifest["embedding_quantization"]
+    version = new_version_name(collection_name)
+    print(f"Importing {len(ids)} chunks from {os.path.basename(snapshot_path)} into {version}...")
+    
+    if store == "numpy":
+        publish_numpy_version(path or NUMPY_STORE_PATH, collection_name, version, collection_metadata,
+                              ids, documents, metadatas, embeddings, dtype=dtype, grace_seconds=grace_seconds)
+    else:
+        import chromadb
+        
+        path = path or CHROMA_PATH
+        publish_chromadb_version(chromadb.PersistentClient(path=path), path, collection_name, version,
+                                 collection_metadata, ids, documents, metadatas,
+                                 embed_rows=lambda rows: embeddings[rows], embeddings=embeddings,
+                                 batch_size=BATCH_SIZE, grace_seconds=grace_seconds)
+    
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a prebuilt Book-Worm index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    export_parser = commands.add_parser("export", help="Package the live index into a snapshot file")
+    export_parser.add_argument("--store", choices=VECTOR_STORES, default=DEFAULT_VECTOR_STORE)
+    export_parser.add_argument("--output-dir", default="snapshots")
+    
+    import_parser = commands.add_parser("import", help="Hydrate the index from a snapshot file")
+    import_parser.add_argument("snapshot")
+    import_parser.add_argument("--store", choices=VECTOR_STORES, default=DEFAULT_VECTOR_STORE)
+    import_parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=DEFAULT_BACKEND,
+                               help="Query-time embedding backend the snapshot must match (default: %(default)s)")
+    import_parser.add_argument("--dtype", choices=STORE_DTYPES, default="float16")
+    import_parser.add_argument("--grace-seconds", type=int, default=GRACE_SECONDS)
+    
+    args = parser.parse_args()
+    try:
+        if args.command == "export":
+            export_snapshot(args.output_dir, store=args.store)
+        else:
+            import_snapshot(args.snapshot, store=args.store, backend=args.backend,
+                            dtype=args.dtype, grace_seconds=args.grace_seconds)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,387 @@
+import os
+import json
+
+from index_alias import alias_stamp, current_version
+
+# Available vector stores:
+#   chroma - ChromaDB collection with an HNSW index (original behaviour)
+#   numpy  - memory-mapped float16/int8 matrix with exact search
+VECTOR_STORES = ["chroma", "numpy"]
+DEFAULT_VECTOR_STORE = os.environ.get("BOOKWORM_VECTOR_STORE", "chroma")
+
+# Storage types for the numpy store's embedding matrix
+STORE_DTYPES = ["float16", "int8"]
+
+CHROMA_PATH = "./chroma_db"
+NUMPY_STORE_PATH = "./vector_store"
+
+# Metadata fields stored as columns (everything ChromaDB metadata holds)
+METADATA_FIELDS = ["series", "type", "name", "section", "sources", "source_count"]
+
+# Rows scored per matrix multiply, bounds the float32 working copy
+SEARCH_BLOCK_ROWS = 65536
+
+# Stores whose float32 matrix fits in this many MB keep it in memory after the
+# first query instead of converting the stored matrix on every search
+SEARCH_CACHE_MB = int(os.environ.get("BOOKWORM_SEARCH_CACHE_MB", "512"))
+
+
+class NumpyVectorStore:
+    """
+    Exact-search vector store backed by memory-mapped NumPy arrays
+    
+    Layout of a store directory:
+        manifest.json     - dtype, dimensions, collection metadata, vocabularies
+        embeddings.npy    - (n, dim) float16 or int8 matrix
+        norms.npy         - (n,) float32 row norms of the stored vectors
+        <field>.npy       - (n,) integer codes into the field's vocabulary
+        documents.bin     - utf-8 document texts, concatenated
+        documents.idx.npy - (n + 1,) byte offsets into documents.bin
+        ids.bin / ids.idx.npy - chunk IDs, same layout as documents
+    
+    query() returns the same structure as a ChromaDB collection so it can be
+    used wherever the code expects one.
+    """
+    
+    def __init__(self, path=NUMPY_STORE_PATH):
+        import numpy as np
+        
+        manifest_path = os.path.join(path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"Vector store {path} does not exist. Build it with: python3 app/load_to_vectordb.py --store numpy")
+        
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        
+        self.path = path
+        self.metadata = self.manifest.get("metadata", {})
+        self.dtype = self.manifest["dtype"]
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode='r')
+        self.vocab = self.manifest["vocab"]
+        # Stores built before a field was added simply don't have its column
+        self.columns = {
+            field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode='r')
+            for field in METADATA_FIELDS if field in self.vocab
+        }
+        self._vocab_index = {
+            field: {value: code for code, value in enumerate(values)}
+            for field, values in self.vocab.items()
+        }
+        self._doc_offsets = np.load(os.path.join(path, "documents.idx.npy"), mmap_mode='r')
+        self._id_offsets = np.load(os.path.join(path, "ids.idx.npy"), mmap_mode='r')
+        self._doc_blob = np.memmap(os.path.join(path, "documents.bin"), dtype=np.uint8, mode='r') if self._doc_offsets[-1] else None
+        self._id_blob = np.memmap(os.path.join(path, "ids.bin"), dtype=np.uint8, mode='r') if self._id_offsets[-1] else None
+        # float32 unit vectors, built on first query if small enough
+        self._unit = None
+    
+    def count(self):
+        """Number of stored chunks"""
+        return int(self.embeddings.shape[0])
+    
+    def _text(self, blob, offsets, row):
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        if blob is None or start == end:
+            return ""
+        return bytes(blob[start:end]).decode('utf-8')
+    
+    def _row_metadata(self, row):
+        return {
+            field: self.vocab[field][int(self.columns[field][row])]
+            for field in self.columns
+        }
+    
+    def _mask(self, where):
+        """Translate a ChromaDB-style where clause into a boolean row mask"""
+        import numpy as np
+        
+        if not where:
+            return None
+        
+        if "$and" in where:
+            mask = np.ones(self.count(), dtype=bool)
+            for clause in where["$and"]:
+                mask &= self._mask(clause)
+            return mask
+        
+        mask = np.ones(self.count(), dtype=bool)
+        for field, condition in where.items():
+            if field not in self.columns:
+                raise ValueError(f"Cannot filter on '{field}'. Filterable fields: {', '.join(self.columns)}")
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    values = [condition["$eq"]]
+                elif "$in" in condition:
+                    values = condition["$in"]
+                else:
+                    raise ValueError(f"Unsupported filter on '{field}': {condition}")
+            else:
+                values = [condition]
+            codes = [self._vocab_index[field][v] for v in values if v in self._vocab_index[field]]
+            mask &= np.isin(self.columns[field], codes)
+        return mask
+    
+    def _unit_matrix(self):
+        """Cached float32 unit-length embeddings, or None if they don't fit SEARCH_CACHE_MB"""
+        import numpy as np
+        
+        if self._unit is None and self.embeddings.size * 4 <= SEARCH_CACHE_MB * 1024 * 1024:
+            unit = np.empty(self.embeddings.shape, dtype=np.float32)
+            for start in range(0, self.count(), SEARCH_BLOCK_ROWS):
+                end = start + SEARCH_BLOCK_ROWS
+                norms = np.clip(np.asarray(self.norms[start:end], dtype=np.float32), 1e-12, None)
+                unit[start:end] = np.asarray(self.embeddings[start:end], dtype=np.float32) / norms[:, None]
+            self._unit = unit
+        return self._unit
+    
+    def _score(self, queries, rows=None):
+        """
+        Cosine scores of the given rows (all rows if None) against unit queries
+        
+        Returns:
+            (len(rows), len(queries)) float32 array
+        """
+        import numpy as np
+        
+        unit = self._unit_matrix()
+        if unit is not None:
+            return (unit if rows is None else unit[rows]) @ queries.T
+        
+        # Too large to cache: convert block by block so the float32 copy stays bounded
+        n = self.count() if rows is None else len(rows)
+        scores = np.empty((n, len(queries)), dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            index = slice(start, start + SEARCH_BLOCK_ROWS) if rows is None else rows[start:start + SEARCH_BLOCK_ROWS]
+            block = np.asarray(self.embeddings[index], dtype=np.float32)
+            norms = np.clip(np.asarray(self.norms[index], dtype=np.float32), 1e-12, None)
+            scores[start:start + len(block)] = (block @ queries.T) / norms[:, None]
+        return scores
+    
+    def query(self, query_embeddings, n_results=10, where=None):
+        """
+        Exact cosine top-k search
+        
+        Args:
+            query_embeddings: List of query vectors
+            n_results: Number of results per query
+            where: Optional filter, e.g. {"series": "Red Rising"} or
+                {"$and": [{"series": ...}, {"type": ...}]}
+        
+        Returns:
+            Dict shaped like ChromaDB query results (ids, documents,
+            metadatas, distances), one list per query
+        """
+        import numpy as np
+        
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        mask = self._mask(where)
+        
+        # Filter first so only matching rows are scored
+        rows = np.flatnonzero(mask) if mask is not None else None
+        scores = self._score(queries, rows)
+        
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for column in scores.T:
+            k = min(n_results, len(column))
+            if k == 0:
+                best = np.array([], dtype=np.int64)
+            else:
+                best = np.argpartition(-column, k - 1)[:k]
+                best = best[np.argsort(-column[best])]
+            distances = [float(1 - column[i]) for i in best]
+            top = rows[best] if rows is not None else best
+            results["ids"].append([self._text(self._id_blob, self._id_offsets, row) for row in top])
+            results["documents"].append([self._text(self._doc_blob, self._doc_offsets, row) for row in top])
+            results["metadatas"].append([self._row_metadata(row) for row in top])
+            results["distances"].append(distances)
+        return results
+    
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        """
+        Fetch stored chunks (ChromaDB-style)
+        
+        Args:
+            ids: Optional list of chunk IDs to fetch
+            where: Optional metadata filter
+            include: Any of "documents", "metadatas", "embeddings"
+            limit, offset: Optional paging over the matching rows
+        
+        Returns:
+            Dict with "ids" plus the requested fields; embeddings are
+            returned as float32 unit vectors
+        """
+        import numpy as np
+        
+        rows = np.arange(self.count())
+        mask = self._mask(where)
+        if mask is not None:
+            rows = rows[mask]
+        if ids is not None:
+            wanted = set(ids)
+            rows = np.array([row for row in rows if self._text(self._id_blob, self._id_offsets, row) in wanted], dtype=np.int64)
+        start = offset or 0
+        rows = rows[start:start + limit] if limit is not None else rows[start:]
+        
+        result = {"ids": [self._text(self._id_blob, self._id_offsets, row) for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._text(self._doc_blob, self._doc_offsets, row) for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._row_metadata(row) for row in rows]
+        if "embeddings" in include:
+            vectors = np.asarray(self.embeddings[rows], dtype=np.float32)
+            norms = np.clip(np.asarray(self.norms[rows], dtype=np.float32), 1e-12, None)
+            result["embeddings"] = vectors / norms[:, None]
+        return result
+
+
+def _write_texts(path, name, texts):
+    """Write texts as a concatenated utf-8 blob plus an offsets array"""
+    import numpy as np
+    
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(os.path.join(path, f"{name}.bin"), 'wb') as f:
+        for b in encoded:
+            f.write(b)
+    np.save(os.path.join(path, f"{name}.idx.npy"), offsets)
+
+
+def build_numpy_store(path, embeddings, documents, metadatas, ids, dtype="float16", metadata=None):
+    """
+    Write a NumpyVectorStore to disk
+    
+    Args:
+        path: Store directory (created if missing)
+        embeddings: (n, dim) array of embeddings
+        documents: Chunk texts
+        metadatas: Chunk metadata dicts (series, type, name, section)
+        ids: Chunk IDs
+        dtype: float16 or int8
+        metadata: Collection-level metadata (embedding model/backend)
+    
+    Returns:
+        The opened NumpyVectorStore
+    """
+    import numpy as np
+    
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unknown store dtype '{dtype}'. Choose from: {', '.join(STORE_DTYPES)}")
+    
+    os.makedirs(path, exist_ok=True)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(len(documents), -1)
+    vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    
+    if dtype == "int8":
+        # Unit vectors lie in [-1, 1], so a fixed scale keeps full precision range
+        stored = np.round(vectors * 127).astype(np.int8)
+    else:
+        stored = vectors.astype(np.float16)
+    norms = np.linalg.norm(stored.astype(np.float32), axis=1).astype(np.float32)
+    
+    np.save(os.path.join(path, "embeddings.npy"), stored)
+    np.save(os.path.join(path, "norms.npy"), norms)
+    
+    # Metadata as columns of small integer codes into per-field vocabularies
+    vocab = {}
+    for field in METADATA_FIELDS:
+        values = [m.get(field, '') for m in metadatas]
+        vocab[field] = sorted(set(values), key=str)
+        index = {value: code for code, value in enumerate(vocab[field])}
+        code_dtype = np.uint16 if len(vocab[field]) < 2 ** 16 else np.uint32
+        np.save(os.path.join(path, f"{field}.npy"), np.array([index[v] for v in values], dtype=code_dtype))
+    
+    _write_texts(path, "documents", documents)
+    _write_texts(path, "ids", ids)
+    
+    manifest = {
+        "dtype": dtype,
+        "count": len(documents),
+        "dimensions": int(vectors.shape[1]) if len(vectors) else 0,
+        "metadata": metadata or {},
+        "vocab": vocab,
+    }
+    with open(os.path.join(path, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    
+    return NumpyVectorStore(path)
+
+
+class AliasedCollection:
+    """
+    Read-only view of whichever index version an alias points to
+    
+    The alias pointer is checked (one stat call) before every operation, so
+    long-lived readers switch to a freshly built version without restarting.
+    Indexes built before aliases existed are opened under the alias name.
+    """
+    
+    def __init__(self, store, alias, path):
+        self.store = store
+        self.alias = alias
+        self.path = path
+        self.version = None
+        self._stamp = None
+        self._collection = None
+        self._refresh()
+    
+    def _open(self, version):
+        if self.store == "numpy":
+            # A store without an alias lives directly in the store directory
+            version_path = self.path if version == self.alias else os.path.join(self.path, version)
+            return NumpyVectorStore(version_path)
+        
+        import chromadb
+        client = chromadb.PersistentClient(path=self.path)
+        return client.get_collection(name=version)
+    
+    def _refresh(self):
+        stamp = alias_stamp(self.path, self.alias)
+        if self._collection is not None and stamp == self._stamp:
+            return
+        version = current_version(self.path, self.alias) or self.alias
+        if version != self.version or self._collection is None:
+            self._collection = self._open(version)
+            self.version = version
+        self._stamp = stamp
+    
+    @property
+    def metadata(self):
+        self._refresh()
+        return self._collection.metadata
+    
+    def count(self):
+        self._refresh()
+        return self._collection.count()
+    
+    def query(self, *args, **kwargs):
+        self._refresh()
+        return self._collection.query(*args, **kwargs)
+    
+    def get(self, *args, **kwargs):
+        self._refresh()
+        return self._collection.get(*args, **kwargs)
+
+
+def open_vector_store(store=None, collection_name="book_worm", path=None):
+    """
+    Open the configured vector store for querying
+    
+    Args:
+        store: chroma or numpy (defaults to BOOKWORM_VECTOR_STORE / chroma)
+        collection_name: Alias of the index to read
+        path: Store directory (defaults to ./chroma_db or ./vector_store)
+    
+    Returns:
+        An AliasedCollection with ChromaDB's query()/count()/metadata interface
+    """
+    store = store or DEFAULT_VECTOR_STORE
+    if store not in VECTOR_STORES:
+        raise ValueError(f"Unknown vector store '{store}'. Choose from: {', '.join(VECTOR_STORES)}")
+    
+    if path is None:
+        path = NUMPY_STORE_PATH if store == "numpy" else CHROMA_PATH
+    return AliasedCollection(store, collection_name, path)